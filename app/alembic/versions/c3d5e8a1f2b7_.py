@@ -0,0 +1,111 @@
+"""partition requestlog by month of created
+
+Revision ID: c3d5e8a1f2b7
+Revises: 6b05f5028e16
+Create Date: 2026-10-18 10:12:41.508316
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d5e8a1f2b7'
+down_revision = '6b05f5028e16'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'created, modified, id, "authorization", method, service_name, ip, request, response, trace'
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    # a table can't be partitioned in place, its logs are copied to a new table.
+    op.rename_table('requestlog', 'requestlog_unpartitioned')
+    op.execute('ALTER INDEX requestlog_pkey RENAME TO requestlog_unpartitioned_pkey')
+    op.execute('ALTER SEQUENCE requestlog_id_seq OWNED BY NONE')
+    op.execute(
+        """
+        CREATE TABLE requestlog (
+            created TIMESTAMP WITH TIME ZONE NOT NULL,
+            modified TIMESTAMP WITH TIME ZONE,
+            id INTEGER NOT NULL DEFAULT nextval('requestlog_id_seq'),
+            "authorization" VARCHAR,
+            method VARCHAR(10),
+            service_name VARCHAR(50),
+            ip VARCHAR(50),
+            request TEXT,
+            response TEXT,
+            trace TEXT,
+            PRIMARY KEY (id, created)
+        ) PARTITION BY RANGE (created)
+        """
+    )
+    op.execute('ALTER SEQUENCE requestlog_id_seq OWNED BY requestlog.id')
+    op.execute('CREATE TABLE requestlog_default PARTITION OF requestlog DEFAULT')
+
+    # monthly partitions from the oldest log up to the next month.
+    oldest = op.get_bind().execute(
+        sa.text('SELECT min(created) FROM requestlog_unpartitioned')
+    ).scalar()
+    current = add_months(datetime.utcnow().date(), 0)
+    month = add_months(oldest.date(), 0) if oldest else current
+    while month <= add_months(current, 1):
+        op.execute(
+            f"CREATE TABLE requestlog_p{month:%Y%m} PARTITION OF requestlog "
+            f"FOR VALUES FROM ('{month} 00:00:00+00') "
+            f"TO ('{add_months(month, 1)} 00:00:00+00')"
+        )
+        month = add_months(month, 1)
+
+    op.execute(
+        f"""
+        INSERT INTO requestlog ({COLUMNS})
+        SELECT coalesce(created, modified, now()), modified, id, "authorization",
+            method, service_name, ip, request, response, trace
+        FROM requestlog_unpartitioned
+        """
+    )
+    op.drop_table('requestlog_unpartitioned')
+    op.create_index('ix_requestlog_created', 'requestlog', ['created'], unique=False, postgresql_using='brin')
+    op.create_index('ix_requestlog_service_name_created', 'requestlog', ['service_name', 'created'], unique=False)
+
+
+def downgrade() -> None:
+    op.rename_table('requestlog', 'requestlog_partitioned')
+    op.execute('ALTER INDEX requestlog_pkey RENAME TO requestlog_partitioned_pkey')
+    op.execute('ALTER SEQUENCE requestlog_id_seq OWNED BY NONE')
+    op.create_table('requestlog',
+    sa.Column('created', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('modified', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('requestlog_id_seq')"), nullable=False),
+    sa.Column('authorization', sa.String(length=256), nullable=True),
+    sa.Column('method', sa.String(length=10), nullable=True),
+    sa.Column('service_name', sa.String(length=50), nullable=True),
+    sa.Column('ip', sa.String(length=50), nullable=True),
+    sa.Column('request', sa.Text(), nullable=True),
+    sa.Column('response', sa.Text(), nullable=True),
+    sa.Column('trace', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE requestlog_id_seq OWNED BY requestlog.id')
+    # the column was bounded before, longer tokens logged since are truncated.
+    op.execute(
+        f"""
+        INSERT INTO requestlog ({COLUMNS})
+        SELECT created, modified, id, left("authorization", 256), method,
+            service_name, ip, request, response, trace
+        FROM requestlog_partitioned
+        """
+    )
+    # dropping the partitioned table drops its partitions.
+    op.drop_table('requestlog_partitioned')
+    op.create_index(op.f('ix_requestlog_created'), 'requestlog', ['created'], unique=False)
+    op.create_index(op.f('ix_requestlog_id'), 'requestlog', ['id'], unique=False)
+    op.create_index(op.f('ix_requestlog_modified'), 'requestlog', ['modified'], unique=False)
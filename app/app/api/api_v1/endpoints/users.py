@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Any
 
-from fastapi import APIRouter, Body, Depends
+from fastapi import APIRouter, Body, Depends, Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import HTTPException
 from starlette import status
@@ -20,7 +20,7 @@ from app import exceptions as exc
 from app.utils.user import (
     verify_password_reset_token,
 )
-from cache import cache, invalidate
+from cache import cache, CacheControl, invalidate, warmup
 from cache.util import ONE_DAY_IN_SECONDS
 
 
@@ -144,8 +144,18 @@ async def reset_password(
 
 
 @router.get("/")
-@cache(namespace=namespace, expire=ONE_DAY_IN_SECONDS)
+@warmup([{"skip": skip, "limit": 100} for skip in range(0, 500, 100)])
+@cache(
+    namespace=namespace,
+    expire=ONE_DAY_IN_SECONDS,
+    vary_on=["role"],
+    entity="user",
+    entity_schema=schemas.User,
+    write_through=True,
+    cache_control=CacheControl(no_cache=True),
+)
 async def read_users(
+    request: Request,
     db: AsyncSession = Depends(deps.get_db_async),
     skip: int = 0,
     limit: int = 100,
@@ -159,7 +169,6 @@ async def read_users(
 
 
 @router.post("/")
-@invalidate(namespace=namespace)
 async def create_user(
     *,
     db: AsyncSession = Depends(deps.get_db_async),
@@ -181,7 +190,6 @@ async def create_user(
 
 
 @router.put("/update/me")
-@invalidate(namespace=namespace)
 async def update_user_me(
     *,
     db: AsyncSession = Depends(deps.get_db_async),
@@ -206,8 +214,18 @@ async def update_user_me(
 
 
 @router.get("/{user_id}")
-@cache(namespace=namespace, expire=ONE_DAY_IN_SECONDS)
+@cache(
+    namespace=namespace,
+    expire=ONE_DAY_IN_SECONDS,
+    vary_on=["principal", "role"],
+    entity="user",
+    entity_schema=schemas.User,
+    write_through=True,
+    negative_ttl=60,
+    cache_control=CacheControl(no_cache=True),
+)
 async def read_user_by_id(
+    request: Request,
     user_id: int,
     current_user: models.User = Depends(deps.get_current_active_user),
     db: AsyncSession = Depends(deps.get_db_async),
@@ -41,6 +41,32 @@ async def test_redis(
         return {"msg": f"ERROR: {str(e)}"}
 
 
+@router.get("/cache-metrics/")
+async def cache_metrics(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Cache metrics of all workers, per namespace.
+    """
+    redis_cache = Cache()
+    if not redis_cache.connected:
+        return {"msg": "Redis is not connected.", "metrics": {}}
+    return {"worker": redis_cache.worker_id, "metrics": await redis_cache.get_metrics()}
+
+
+@router.get("/cache-usage/")
+async def cache_usage(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Keys and bytes cached in Redis per namespace, with their quota.
+    """
+    redis_cache = Cache()
+    if not redis_cache.connected:
+        return {"msg": "Redis is not connected.", "usage": {}}
+    return {"usage": await redis_cache.get_usage()}
+
+
 @router.websocket("/echo-client/")
 async def echo_client(websocket: WebSocket):
     await websocket.accept()
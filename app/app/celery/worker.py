@@ -1,6 +1,15 @@
+from app import crud
 from app.core.celery_app import celery_app
+from app.db.session import SessionLocal
+from app.log.sinks import decode_request_logs
 
 
 @celery_app.task(name="app.celery.worker.test_celery")
 def test_celery(word: str) -> str:
     return f"test task return {word}"
+
+
+@celery_app.task(name="app.celery.worker.save_request_logs", ignore_result=True)
+def save_request_logs(data: str) -> None:
+    with SessionLocal() as db:
+        crud.request_log.create_multi(db, objs_in=decode_request_logs(data))
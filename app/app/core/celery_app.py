@@ -7,5 +7,11 @@ BROKER_URL = f"amqp://{settings.RABBITMQ_USERNAME}:{settings.RABBITMQ_PASSWORD}@
 print(f"---------{BROKER_URL}-----")
 celery_app = Celery("worker", backend="rpc://", broker=BROKER_URL)
 
-celery_app.conf.task_routes = {"app.celery.worker.test_celery": "main-queue"}
+# request logs are written from their own queue, so they never delay other tasks.
+REQUEST_LOG_QUEUE = "request-log-queue"
+
+celery_app.conf.task_routes = {
+    "app.celery.worker.test_celery": "main-queue",
+    "app.celery.worker.save_request_logs": REQUEST_LOG_QUEUE,
+}
 celery_app.conf.update(task_track_started=True)
@@ -37,6 +37,41 @@ class Settings(BaseSettings):
     REDIS_PORT: int
     REDIS_PASSWORD: str
     REDIS_TIMEOUT: Optional[int] = 5
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_HEALTH_CHECK_INTERVAL: int = 5
+    REDIS_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    REDIS_CIRCUIT_RESET_TIMEOUT: int = 10
+    REDIS_METRICS_INTERVAL: int = 10
+    REDIS_LOCAL_CACHE_SIZE: int = 1024
+    REDIS_LOCAL_CACHE_TTL: int = 30
+    REDIS_COMPRESSION: Optional[str] = None
+    REDIS_COMPRESSION_THRESHOLD: int = 1024
+    CACHE_MAX_KEYS: int = 0
+    CACHE_MAX_BYTES: int = 0
+    CACHE_MAX_PAYLOAD_BYTES: int = 0
+    CACHE_MIN_REQUESTS: int = 0
+    CACHE_WARMUP_CONCURRENCY: int = 10
+    CACHE_WARMUP_INTERVAL: int = 600
+
+    REQUEST_LOG_QUEUE_SIZE: int = 10000
+    REQUEST_LOG_BATCH_SIZE: int = 500
+    REQUEST_LOG_FLUSH_INTERVAL: float = 1.0
+    REQUEST_LOG_OVERFLOW: str = "drop"
+    # months of logs kept besides the current one, 0 keeps every log
+    REQUEST_LOG_RETENTION_MONTHS: int = 6
+    REQUEST_LOG_PARTITIONS_AHEAD: int = 2
+    REQUEST_LOG_SAMPLE_RATE: float = 1.0
+    REQUEST_LOG_MAX_BODY_BYTES: int = 4096
+    # policies of path prefixes, e.g. {"/api/v1/users/": {"sample_rate": 0.1}}
+    REQUEST_LOG_POLICIES: Dict[str, Dict[str, Any]] = {}
+    # where the logs are written: "db", "celery" or "redis" (a Redis Stream)
+    REQUEST_LOG_SINK: str = "db"
+    REQUEST_LOG_STREAM: str = "request-logs"
+    REQUEST_LOG_STREAM_MAXLEN: int = 100000
+    # stable across restarts, the consumer keeps the entries it read but didn't write
+    REQUEST_LOG_STREAM_CONSUMER: str = "scheduler"
+    # seconds after which the unwritten entries of any consumer are claimed again
+    REQUEST_LOG_STREAM_CLAIM_IDLE: int = 60
 
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = []
     authjwt_secret_key: str = "secret"
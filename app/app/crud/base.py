@@ -8,6 +8,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.crud import events
+from app.crud.events import EntityAction, EntityChange
 from app.db.base_class import Base
 
 
@@ -29,17 +31,27 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         self.model = model
 
     async def _commit_refresh_async(
-        self, db: AsyncSession, db_obj: ModelType
+        self,
+        db: AsyncSession,
+        db_obj: ModelType,
+        action: EntityAction = EntityAction.UPDATE,
     ) -> ModelType:
         await db.commit()
         await db.refresh(db_obj)
+        await events.publish(
+            EntityChange(self.model.__tablename__, db_obj.id, action, db_obj)
+        )
         return db_obj
 
     def _commit_refresh(
-        self, db: Session | AsyncSession, db_obj: ModelType
+        self,
+        db: Session | AsyncSession,
+        db_obj: ModelType,
+        action: EntityAction = EntityAction.UPDATE,
     ) -> ModelType | Awaitable[ModelType]:
+        # events are only published for async sessions, which the API uses.
         if isinstance(db, AsyncSession):
-            return self._commit_refresh_async(db, db_obj=db_obj)
+            return self._commit_refresh_async(db, db_obj=db_obj, action=action)
         db.commit()
         db.refresh(db_obj)
         return db_obj
@@ -100,7 +112,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)  # type: ignore
         db.add(db_obj)
-        return self._commit_refresh(db=db, db_obj=db_obj)
+        return self._commit_refresh(db=db, db_obj=db_obj, action=EntityAction.CREATE)
 
     def update(
         self,
@@ -130,7 +142,9 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         if hasattr(self.model, "modified"):
             setattr(db_obj, "modified", datetime.now())
 
-        return await self._commit_refresh_async(db, db_obj=db_obj)
+        return await self._commit_refresh_async(
+            db, db_obj=db_obj, action=EntityAction.REMOVE
+        )
 
     def remove(
         self, db: Session | AsyncSession, *, id: int
@@ -144,4 +158,4 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         if hasattr(self.model, "modified"):
             setattr(db_obj, "modified", datetime.now())
 
-        return self._commit_refresh(db, db_obj=db_obj)
+        return self._commit_refresh(db, db_obj=db_obj, action=EntityAction.REMOVE)
@@ -1,10 +1,28 @@
+from typing import Any, Awaitable, Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
 from app.crud.base import CRUDBase
 from app.schemas.request_log import RequestLogCreate, RequestLogUpdate
 from app.models.request_log import RequestLog
 
 
 class CRUDRequestLog(CRUDBase[RequestLog, RequestLogCreate, RequestLogUpdate]):
-    pass
+    async def _create_multi_async(self, db: AsyncSession, query) -> None:
+        await db.execute(query)
+        await db.commit()
+
+    def create_multi(
+        self, db: Session | AsyncSession, *, objs_in: List[Dict[str, Any]]
+    ) -> None | Awaitable[None]:
+        """Insert many logs with a single multi-row INSERT."""
+        query = insert(self.model).values(objs_in)
+        if isinstance(db, AsyncSession):
+            return self._create_multi_async(db, query)
+        db.execute(query)
+        db.commit()
 
 
 request_log = CRUDRequestLog(RequestLog)
@@ -0,0 +1,49 @@
+"""Entity change events, published by CRUDBase after a write is committed."""
+import logging
+from enum import Enum
+from typing import Any, Awaitable, Callable, List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class EntityAction(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    REMOVE = "remove"
+
+
+class EntityChange(NamedTuple):
+    entity: str
+    id: Any
+    action: EntityAction
+    obj: Any
+
+
+EntityChangeHandler = Callable[[EntityChange], Awaitable[None]]
+
+_handlers: List[EntityChangeHandler] = []
+
+
+def subscribe(handler: EntityChangeHandler) -> None:
+    if handler not in _handlers:
+        _handlers.append(handler)
+
+
+def unsubscribe(handler: EntityChangeHandler) -> None:
+    if handler in _handlers:
+        _handlers.remove(handler)
+
+
+async def publish(change: EntityChange) -> None:
+    """Call every handler with `change`.
+
+    The change is already committed, so a failing handler is logged instead of
+    failing the request.
+    """
+    for handler in _handlers:
+        try:
+            await handler(change)
+        except Exception:
+            logger.exception(
+                f"Failed to handle {change.action.value} of {change.entity}:{change.id}"
+            )
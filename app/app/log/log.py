@@ -1,57 +1,141 @@
 import logging
 import json
-from typing import Callable
+from datetime import datetime
+from typing import Callable, List, Optional
 
 from fastapi import Request, BackgroundTasks
 from fastapi.routing import APIRoute
 from fastapi.responses import Response
+from starlette.types import Message, Receive
 
-from app import crud, schemas, exceptions
-from app.db.session import async_session
+from app import schemas, exceptions
+from app.core.config import settings
+from app.log.policy import (
+    format_body,
+    get_log_policy,
+    redact_authorization,
+    redact_text,
+)
+from app.log.sinks import get_request_log_sink
+from app.log.writer import RequestLogRow, RequestLogWriter
 
 
 logger = logging.getLogger(__name__)
 
 
+class BodyCapture:
+    """
+    Keeps the first bytes of a request body while the route handler reads it, so
+    the body is logged without being read or parsed again.
+
+    **Parameters**
+
+    * `receive`: The ASGI receive channel of the request
+    * `max_bytes`: Number of bytes of the body that are kept
+    """
+
+    def __init__(self, receive: Receive, max_bytes: int):
+        self._receive = receive
+        self.max_bytes = max_bytes
+        self.body = bytearray()
+        self.size = 0
+
+    async def receive(self) -> Message:
+        message = await self._receive()
+        if message["type"] == "http.request":
+            chunk = message.get("body", b"")
+            self.size += len(chunk)
+            if len(self.body) < self.max_bytes:
+                self.body += chunk[: self.max_bytes - len(self.body)]
+        return message
+
+
+def format_request_log(row: RequestLogRow) -> RequestLogRow:
+    """Turn a queued log into the row of its table, redacting and truncating its
+    bodies.
+    """
+    row = dict(row)
+    max_bytes = row.pop("max_body_bytes")
+    request_data = dict(row["request"])
+    request_data["body"] = format_body(
+        request_data["body"], max_bytes, row.pop("request_size")
+    )
+    row["request"] = json.dumps(request_data)
+    row["response"] = format_body(row["response"], max_bytes)
+    request_log_in = schemas.RequestLogCreate(**row)
+    return {
+        **request_log_in.dict(),
+        "created": row["created"],
+        "modified": row["modified"],
+    }
+
+
+def format_request_logs(rows: List[RequestLogRow]) -> List[RequestLogRow]:
+    return [format_request_log(row) for row in rows]
+
+
+request_log_writer = RequestLogWriter(
+    max_size=settings.REQUEST_LOG_QUEUE_SIZE,
+    batch_size=settings.REQUEST_LOG_BATCH_SIZE,
+    flush_interval=settings.REQUEST_LOG_FLUSH_INTERVAL,
+    overflow=settings.REQUEST_LOG_OVERFLOW,
+    write=get_request_log_sink(settings.REQUEST_LOG_SINK),
+    prepare=format_request_logs,
+)
+
+
 async def save_request_log_async(
-    request: Request, response: Response = None, trace_back: str = ""
+    request: Request,
+    response: Response = None,
+    trace_back: str = "",
+    body: Optional[BodyCapture] = None,
 ) -> None:
-    authorization = request.headers.get("authorization")
-    client_host = request.client.host
     service_name = request.url.path
-    method = request.method
+    policy = get_log_policy(service_name)
+    status_code = response.status_code if response and not trace_back else 500
+    if not policy.should_log(status_code):
+        return
+
     request_data = {
-        "body": {},
+        "body": b"",
         "path_params": str(request.path_params),
-        "query_params": str(request.query_params),
+        "query_params": redact_text(str(request.query_params)),
     }
+    request_size = 0
+    if body is not None:
+        request_data["body"] = body.body
+        request_size = body.size
+    else:
+        try:
+            request_data["body"] = await request.body()
+        except Exception as e:
+            pass
 
     response_data = ""
     if response:
         if "json" not in response.headers.get("content-type"):
             response_data = json.dumps(dict(response.headers))
         else:
-            response_data = str(response.body)
-
-    try:
-        request_data["body"] = await request.json()
-    except Exception as e:
-        pass
-
-    request_log_data = {
-        "authorization": authorization,
-        "service_name": service_name,
-        "method": method,
-        "ip": client_host,
-        "request": json.dumps(request_data),
-        "response": response_data,
-        "trace": trace_back,
-    }
+            response_data = response.body
 
-    request_log_in = schemas.RequestLogCreate(**request_log_data)
-    async with async_session() as db:
-        await crud.request_log.create(db=db, obj_in=request_log_in)
-        await db.commit()
+    # the bodies are formatted by the background writer, off the event loop, and
+    # the log is written in a batch with other logs.
+    now = datetime.utcnow()
+    request_log_writer.enqueue(
+        {
+            "authorization": redact_authorization(request.headers.get("authorization")),
+            "service_name": service_name,
+            "method": request.method,
+            "ip": request.client.host,
+            "request": request_data,
+            "response": response_data,
+            "trace": trace_back,
+            "max_body_bytes": policy.max_body_bytes,
+            "request_size": request_size,
+            "created": now,
+            "modified": now,
+        }
+    )
 
 
 class LogRoute(APIRoute):
@@ -59,6 +143,9 @@ class LogRoute(APIRoute):
         original_route_handler = super().get_route_handler()
 
         async def custom_route_handler(request: Request) -> Response:
+            policy = get_log_policy(request.url.path)
+            body = BodyCapture(request.receive, policy.max_body_bytes)
+            request = Request(request.scope, body.receive)
             try:
                 response: Response = await original_route_handler(request)
             except Exception as e:
@@ -67,10 +154,12 @@ class LogRoute(APIRoute):
 
             if not response.background:
                 tasks = BackgroundTasks()
-                tasks.add_task(save_request_log_async, request, response)
+                tasks.add_task(save_request_log_async, request, response, body=body)
                 response.background = tasks
             else:
-                response.background.add_task(save_request_log_async, request, response)
+                response.background.add_task(
+                    save_request_log_async, request, response, body=body
+                )
             return response
 
         return custom_route_handler
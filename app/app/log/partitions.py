@@ -0,0 +1,111 @@
+import logging
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session
+from app.models.request_log import RequestLog
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = RequestLog.__tablename__
+PARTITION_PATTERN = re.compile(rf"^{TABLE_NAME}_p(\d{{4}})(\d{{2}})$")
+
+LIST_PARTITIONS = text(
+    """
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+    JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+    WHERE parent.relname = :table_name
+    """
+)
+
+
+def get_month(day: date, months: int = 0) -> date:
+    """Return the first day of the month `months` after the month of `day`."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month: date) -> str:
+    return f"{TABLE_NAME}_p{month:%Y%m}"
+
+
+def get_partition_month(name: str) -> Optional[date]:
+    """Return the month of a monthly partition, None for any other table."""
+    match = PARTITION_PATTERN.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def get_expired_partitions(names: List[str], before: date) -> List[str]:
+    """Return the monthly partitions that only hold logs created before `before`."""
+    return sorted(
+        name
+        for name in names
+        if (month := get_partition_month(name)) is not None
+        and get_month(month, 1) <= before
+    )
+
+
+async def create_partitions(db: AsyncSession, start: date, months: int) -> List[str]:
+    """Create the partitions of the `months` months from the month of `start`."""
+    names = []
+    for i in range(months):
+        month = get_month(start, i)
+        name = get_partition_name(month)
+        await db.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE_NAME} "
+                f"FOR VALUES FROM ('{month} 00:00:00+00') "
+                f"TO ('{get_month(month, 1)} 00:00:00+00')"
+            )
+        )
+        names.append(name)
+    await db.commit()
+    return names
+
+
+async def drop_partitions(db: AsyncSession, before: date) -> List[str]:
+    """Drop the monthly partitions of the logs created before `before`.
+
+    Dropping a partition removes its logs at once, without the dead rows and the
+    index maintenance of a DELETE.
+    """
+    result = await db.execute(LIST_PARTITIONS, {"table_name": TABLE_NAME})
+    names = get_expired_partitions(result.scalars().all(), before)
+    for name in names:
+        await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    await db.commit()
+    return names
+
+
+async def maintain_partitions(
+    retention_months: int, months_ahead: int, today: Optional[date] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Create the partitions of the coming months and drop the expired ones.
+
+    **Parameters**
+
+    * `retention_months`: Number of past months of logs to keep, besides the
+      current month. 0 keeps every log
+    * `months_ahead`: Number of months after the current one to create partitions
+      for, so logs never fall into the default partition
+    * `today`: The current date, today (UTC) by default
+
+    Returns the created and the dropped partitions.
+    """
+    month = get_month(today or datetime.utcnow().date())
+    async with async_session() as db:
+        created = await create_partitions(db, month, months_ahead + 1)
+        dropped = []
+        if retention_months:
+            dropped = await drop_partitions(db, get_month(month, -retention_months))
+    if dropped:
+        logger.info(f"Dropped request log partitions {', '.join(dropped)}")
+    return created, dropped
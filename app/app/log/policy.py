@@ -0,0 +1,124 @@
+import json
+import random
+import re
+from typing import Any, Dict, NamedTuple, Optional
+
+from app.core.config import settings
+
+REDACTED = "[REDACTED]"
+# keys of request and response bodies, and query parameters, that hold secrets.
+SECRET_KEYS = {
+    "access_token",
+    "authorization",
+    "client_secret",
+    "hashed_password",
+    "new_password",
+    "password",
+    "refresh_token",
+    "secret",
+    "token",
+}
+# `key=value` and `"key": "value"` pairs of secrets in bodies that are not JSON.
+SECRET_PATTERN = re.compile(
+    rf"""(["']?(?:{"|".join(sorted(SECRET_KEYS))})["']?\s*[=:]\s*)"""
+    r"""("[^"]*"|[^&\s,}]*)""",
+    re.IGNORECASE,
+)
+
+
+class LogPolicy(NamedTuple):
+    """
+    What is logged of the requests to a route.
+
+    **Parameters**
+
+    * `sample_rate`: Fraction of the requests with a response below 500 that are
+      logged. Failed requests (5xx or an exception) are always logged
+    * `max_body_bytes`: Number of bytes of the request and response bodies that are
+      stored, longer bodies are truncated. 0 doesn't store them
+    """
+
+    sample_rate: float = 1.0
+    max_body_bytes: int = 4096
+
+    def should_log(self, status_code: int) -> bool:
+        if status_code >= 500:
+            return True
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+
+default_log_policy = LogPolicy(
+    sample_rate=settings.REQUEST_LOG_SAMPLE_RATE,
+    max_body_bytes=settings.REQUEST_LOG_MAX_BODY_BYTES,
+)
+# policies of the routes whose path starts with a prefix, the longest prefix wins.
+log_policies: Dict[str, LogPolicy] = {
+    prefix: default_log_policy._replace(**policy)
+    for prefix, policy in settings.REQUEST_LOG_POLICIES.items()
+}
+
+
+def set_log_policy(prefix: str, policy: LogPolicy) -> None:
+    log_policies[prefix] = policy
+
+
+def get_log_policy(path: str) -> LogPolicy:
+    prefix = max(
+        (prefix for prefix in log_policies if path.startswith(prefix)),
+        key=len,
+        default=None,
+    )
+    return default_log_policy if prefix is None else log_policies[prefix]
+
+
+def redact(data: Any) -> Any:
+    """Replace the values of secret keys in parsed JSON, at any depth."""
+    if isinstance(data, dict):
+        return {
+            key: REDACTED if key.lower() in SECRET_KEYS else redact(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [redact(value) for value in data]
+    return data
+
+
+def redact_text(text: str) -> str:
+    return SECRET_PATTERN.sub(rf"\1{REDACTED}", text)
+
+
+def redact_authorization(authorization: Optional[str]) -> Optional[str]:
+    """Keep only the scheme of the credentials, such as `Bearer`."""
+    if not authorization:
+        return authorization
+    scheme, _, credentials = authorization.partition(" ")
+    return f"{scheme} {REDACTED}" if credentials else REDACTED
+
+
+def truncate(text: str, max_bytes: int, size: int = 0) -> str:
+    """Keep the first `max_bytes` bytes of `text`, `size` is the size of the text
+    it was cut from, if it was.
+    """
+    data = text.encode()
+    size = max(size, len(data))
+    if size <= max_bytes:
+        return text
+    kept = data[:max_bytes].decode(errors="ignore")
+    return f"{kept}...[truncated {size - max_bytes} bytes]"
+
+
+def format_body(body: bytes | bytearray | str, max_bytes: int, size: int = 0) -> str:
+    """Redact the secrets of a request or response body and truncate it.
+
+    `size` is the size of the whole body, if only its first bytes were captured.
+    They are redacted as text, since they can't be parsed.
+    """
+    if not body or not max_bytes:
+        return ""
+    try:
+        text = json.dumps(redact(json.loads(body)))
+    except ValueError:
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode(errors="replace")
+        text = redact_text(body)
+    return truncate(text, max_bytes, size)
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from enum import Enum
+from typing import Awaitable, Callable, List, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from app.core.celery_app import celery_app, REQUEST_LOG_QUEUE
+from app.core.config import settings
+from app.log.writer import RequestLogRow, write_request_logs
+
+SAVE_REQUEST_LOGS_TASK = "app.celery.worker.save_request_logs"
+STREAM_GROUP = "request-log-writers"
+DATETIME_FIELDS = ("created", "modified")
+
+logger = logging.getLogger(__name__)
+
+RequestLogSinkWrite = Callable[[List[RequestLogRow]], Awaitable[None]]
+
+_redis: Optional[redis.Redis] = None
+
+
+class RequestLogSink(str, Enum):
+    # the API writes the logs to the database.
+    DB = "db"
+    # a Celery worker writes the logs, from a dedicated queue.
+    CELERY = "celery"
+    # the logs are added to a Redis Stream, which the scheduler writes to the
+    # database.
+    REDIS = "redis"
+
+
+def encode_request_logs(rows: List[RequestLogRow]) -> str:
+    return json.dumps(rows, default=datetime.isoformat)
+
+
+def decode_request_logs(data: str | bytes) -> List[RequestLogRow]:
+    rows = json.loads(data)
+    for row in rows:
+        for field in DATETIME_FIELDS:
+            if row.get(field):
+                row[field] = datetime.fromisoformat(row[field])
+    return rows
+
+
+async def send_request_logs_to_celery(rows: List[RequestLogRow]) -> None:
+    # publishing blocks on the broker, it runs in a thread.
+    await asyncio.to_thread(
+        celery_app.send_task,
+        SAVE_REQUEST_LOGS_TASK,
+        args=[encode_request_logs(rows)],
+        queue=REQUEST_LOG_QUEUE,
+        ignore_result=True,
+    )
+
+
+def get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        url = (
+            f"redis://:{settings.REDIS_PASSWORD}"
+            f"@{settings.REDIS_SERVER}:{settings.REDIS_PORT}"
+        )
+        _redis = redis.from_url(url, socket_timeout=settings.REDIS_TIMEOUT)
+    return _redis
+
+
+async def add_request_logs_to_stream(rows: List[RequestLogRow]) -> None:
+    # the stream is capped, so logs that are never consumed don't fill up Redis.
+    await get_redis().xadd(
+        settings.REQUEST_LOG_STREAM,
+        {"rows": encode_request_logs(rows)},
+        maxlen=settings.REQUEST_LOG_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+async def consume_request_log_stream(
+    redis_client: Optional[redis.Redis] = None,
+    write: RequestLogSinkWrite = write_request_logs,
+    count: int = 10,
+) -> int:
+    """
+    Write the logs of the Redis Stream to the database until it is drained.
+
+    Each stream entry holds a batch of logs, which is written by one INSERT. Entries
+    are deleted once written. Entries whose write failed stay pending, and once they
+    have been idle for `REQUEST_LOG_STREAM_CLAIM_IDLE` seconds they are claimed and
+    written again by the next call, whichever consumer read them. Pending entries
+    trimmed from the stream (by its MAXLEN) are lost, they are only acknowledged.
+
+    **Parameters**
+
+    * `redis_client`: The Redis client, the client of the sink by default
+    * `write`: Writes a batch of logs, to the database by default
+    * `count`: Number of entries read at once
+
+    Returns the number of logs written.
+    """
+    redis_client = redis_client or get_redis()
+    stream = settings.REQUEST_LOG_STREAM
+    consumer = settings.REQUEST_LOG_STREAM_CONSUMER
+    try:
+        await redis_client.xgroup_create(stream, STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+    async def write_entries(entries) -> int:
+        written = 0
+        for entry_id, fields in entries:
+            if not fields:
+                # the entry was trimmed after it was read, only its id is left.
+                await redis_client.xack(stream, STREAM_GROUP, entry_id)
+                continue
+            rows = decode_request_logs(fields[b"rows"])
+            try:
+                await write(rows)
+            except Exception:
+                # the entry stays pending, it is claimed again once idle.
+                logger.exception(f"Failed to write {len(rows)} streamed request logs")
+                continue
+            await redis_client.xack(stream, STREAM_GROUP, entry_id)
+            await redis_client.xdel(stream, entry_id)
+            written += len(rows)
+        return written
+
+    written = 0
+    # the entries read before but not written, by any consumer, then the new ones.
+    start_id = "0-0"
+    while True:
+        start_id, entries, *_ = await redis_client.xautoclaim(
+            stream,
+            STREAM_GROUP,
+            consumer,
+            settings.REQUEST_LOG_STREAM_CLAIM_IDLE * 1000,
+            start_id=start_id,
+            count=count,
+        )
+        written += await write_entries(entries)
+        if start_id in (b"0-0", "0-0"):
+            break
+    while True:
+        response = await redis_client.xreadgroup(
+            STREAM_GROUP, consumer, {stream: ">"}, count=count
+        )
+        entries = response[0][1] if response else []
+        if not entries:
+            break
+        written += await write_entries(entries)
+    return written
+
+
+def get_request_log_sink(sink: RequestLogSink) -> RequestLogSinkWrite:
+    return {
+        RequestLogSink.DB: write_request_logs,
+        RequestLogSink.CELERY: send_request_logs_to_celery,
+        RequestLogSink.REDIS: add_request_logs_to_stream,
+    }[RequestLogSink(sink)]
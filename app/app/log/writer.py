@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import random
+import time
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app import crud
+from app.db.session import async_session
+
+logger = logging.getLogger(__name__)
+
+RequestLogRow = Dict[str, Any]
+# queued by `RequestLogWriter.stop`, the writer stops once it has written the logs
+# queued before it.
+STOP = object()
+
+
+class OverflowPolicy(str, Enum):
+    # drop new logs once the queue is full.
+    DROP = "drop"
+    # keep a decreasing fraction of new logs once the queue is half full, so the
+    # logs of a load spike are sampled instead of cut off.
+    SAMPLE = "sample"
+
+
+async def write_request_logs(rows: List[RequestLogRow]) -> None:
+    async with async_session() as db:
+        await crud.request_log.create_multi(db, objs_in=rows)
+
+
+class RequestLogWriter:
+    """
+    Writes request logs to the database in batches, from a background task.
+
+    Requests only add their log to a bounded queue. The queue is flushed with a
+    single multi-row INSERT when `batch_size` logs are waiting, or `flush_interval`
+    seconds after the first of them was queued, and when the writer is stopped.
+
+    **Parameters**
+
+    * `max_size`: Number of logs the queue holds before `overflow` applies
+    * `batch_size`: Maximum number of logs written by one INSERT
+    * `flush_interval`: Maximum number of seconds a log waits in the queue
+    * `overflow`: What happens to new logs when the queue is (nearly) full
+    * `write`: Writes a batch of logs, to the database by default
+    * `prepare`: Turns a batch of queued logs into rows before they are written. It
+      runs in a thread, so it doesn't block the event loop
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        overflow: OverflowPolicy = OverflowPolicy.DROP,
+        write: Callable[[List[RequestLogRow]], Awaitable[None]] = write_request_logs,
+        prepare: Optional[Callable[[List[RequestLogRow]], List[RequestLogRow]]] = None,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = OverflowPolicy(overflow)
+        self.write = write
+        self.prepare = prepare
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.written = 0
+
+    def start(self) -> None:
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_size)
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write the queued logs and stop the background task."""
+        if self.task is None:
+            return
+        await self.queue.put(STOP)
+        await self.task
+        self.task = None
+
+    def enqueue(self, row: RequestLogRow) -> bool:
+        """Queue a log without waiting, return False if it was dropped."""
+        self.start()
+        if not self._admit():
+            self.dropped += 1
+            return False
+        self.queue.put_nowait(row)
+        return True
+
+    def _admit(self) -> bool:
+        size = self.queue.qsize()
+        if size >= self.max_size:
+            return False
+        if self.overflow == OverflowPolicy.SAMPLE and size >= self.max_size // 2:
+            # the fraction of kept logs falls from 1 to 0 as the queue fills up.
+            free = self.max_size - size
+            return random.random() < free / (self.max_size - self.max_size // 2)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            rows = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size and rows[-1] is not STOP:
+                if not self.queue.empty():
+                    rows.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if rows[-1] is STOP:
+                await self._flush(rows[:-1])
+                return
+            await self._flush(rows)
+
+    async def _flush(self, rows: List[RequestLogRow]) -> None:
+        if not rows:
+            return
+        try:
+            if self.prepare is not None:
+                rows = await asyncio.to_thread(self.prepare, rows)
+            await self.write(rows)
+        except Exception:
+            # the logs are lost, but the writer keeps running.
+            self.dropped += len(rows)
+            logger.exception(f"Failed to write {len(rows)} request logs")
+            return
+        self.written += len(rows)
@@ -1,19 +1,19 @@
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI
 
 from starlette.middleware.cors import CORSMiddleware
 
-from sqlalchemy.orm import Session
-from sqlalchemy.ext.asyncio import AsyncSession
-
 from app.api.api_v1.api import api_router
 from app.core.config import settings
-from app.models import User
+from app.crud import events as crud_events
+from app.crud.events import EntityAction, EntityChange
 from app.exceptions import (
     http_exceptions,
     internal_exceptions,
     internal_service_exceptions,
     validation_exceptions,
 )
+from app.log.log import request_log_writer
+from app.utils.cache_setup import init_cache
 from cache import Cache
 
 
@@ -40,13 +40,22 @@ app.add_exception_handler(*validation_exceptions)
 app.add_exception_handler(*http_exceptions)
 
 
+async def invalidate_changed_entity(change: EntityChange) -> None:
+    # invalidations that can't be delivered are retried once Redis is reachable.
+    await Cache().invalidate_entity(
+        change.entity,
+        None if change.action == EntityAction.CREATE else change.id,
+        None if change.action == EntityAction.REMOVE else change.obj,
+    )
+
+
 @app.on_event("startup")
 async def startup():
-    redis_cache = Cache()
-    url = f"redis://:{settings.REDIS_PASSWORD}@{settings.REDIS_SERVER}:{settings.REDIS_PORT}"
-    await redis_cache.init(
-        host_url=url,
-        prefix="api-cache",
-        response_header="X-API-Cache",
-        ignore_arg_types=[Request, Response, Session, AsyncSession, User],
-    )
+    await init_cache()
+    crud_events.subscribe(invalidate_changed_entity)
+    request_log_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await request_log_writer.stop()
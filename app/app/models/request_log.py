@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, Text, String
+from datetime import datetime
+
+from sqlalchemy import Column, DDL, DateTime, event, Index, Integer, Text, String
 
 from app.db.base_class import Base
 
 
 class RequestLog(Base):
-    id = Column(Integer, primary_key=True, index=True)
+    # the table is partitioned by month of `created`, see app/log/partitions.py.
+    # Postgres requires the partition key in the primary key.
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created = Column(DateTime(timezone=True), primary_key=True, default=datetime.utcnow)
+    modified = Column(
+        DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow
+    )
 
     authorization = Column(String, nullable=True)
     method = Column(String(10), nullable=True)
@@ -14,5 +22,23 @@ class RequestLog(Base):
     response = Column(Text, nullable=True)
     trace = Column(Text, nullable=True, default="")
 
+    __table_args__ = (
+        # logs are inserted in `created` order, a BRIN index stays tiny.
+        Index("ix_requestlog_created", "created", postgresql_using="brin"),
+        Index("ix_requestlog_service_name_created", "service_name", "created"),
+        {"postgresql_partition_by": "RANGE (created)"},
+    )
+
     def __str__(self):
         return "%s: %s, %s" % (self.service_name, self.ip, self.created)
+
+
+# logs outside of the monthly partitions are kept in the default partition.
+event.listen(
+    RequestLog.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS requestlog_default "
+        "PARTITION OF requestlog DEFAULT"
+    ),
+)
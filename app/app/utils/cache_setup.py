@@ -0,0 +1,55 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core.config import settings
+from app.db.session import async_session
+from app.models import User
+from cache import Cache, get_compressor, Quota
+
+
+async def init_cache() -> Cache:
+    redis_cache = Cache()
+    url = (
+        f"redis://:{settings.REDIS_PASSWORD}"
+        f"@{settings.REDIS_SERVER}:{settings.REDIS_PORT}"
+    )
+    await redis_cache.init(
+        host_url=url,
+        prefix="api-cache",
+        response_header="X-API-Cache",
+        ignore_arg_types=[Request, Response, Session, AsyncSession, User],
+        local_cache_size=settings.REDIS_LOCAL_CACHE_SIZE,
+        local_cache_ttl=settings.REDIS_LOCAL_CACHE_TTL,
+        compressor=get_compressor(settings.REDIS_COMPRESSION),
+        compression_threshold=settings.REDIS_COMPRESSION_THRESHOLD,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_TIMEOUT,
+        pool_timeout=settings.REDIS_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        failure_threshold=settings.REDIS_CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=settings.REDIS_CIRCUIT_RESET_TIMEOUT,
+        metrics_interval=settings.REDIS_METRICS_INTERVAL,
+        quota=Quota(
+            max_keys=settings.CACHE_MAX_KEYS,
+            max_bytes=settings.CACHE_MAX_BYTES,
+            max_payload_bytes=settings.CACHE_MAX_PAYLOAD_BYTES,
+            min_requests=settings.CACHE_MIN_REQUESTS,
+        ),
+    )
+    return redis_cache
+
+
+@asynccontextmanager
+async def warmup_dependencies() -> AsyncIterator[Dict[str, Any]]:
+    """Provide the dependencies of the endpoints while the cache is warmed up.
+
+    Endpoints are called as the first superuser, without a request.
+    """
+    async with async_session() as db:
+        current_user = await crud.user.get_by_email(db, email=settings.FIRST_SUPERUSER)
+        yield {"request": None, "db": db, "current_user": current_user}
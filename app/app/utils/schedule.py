@@ -1,6 +1,14 @@
+import asyncio
 import logging
 from rocketry import Rocketry
 
+from app.api.api_v1 import api  # noqa: F401 registers the warmup of the endpoints
+from app.core.config import settings
+from app.log.partitions import maintain_partitions
+from app.log.sinks import consume_request_log_stream, RequestLogSink
+from app.utils.cache_setup import init_cache, warmup_dependencies
+from cache import Cache, warm_up
+
 logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__file__)
 
@@ -15,5 +23,45 @@ async def test_rocketry():
     logger.info("------rocketry run schedule-------")
 
 
+@app.task(f"every {settings.CACHE_WARMUP_INTERVAL} seconds")
+async def prewarm_cache():
+    # the health monitor of the cache reconnects to Redis once it is back up.
+    if not Cache().connected:
+        logger.warning("Redis is not connected, skipping cache warmup")
+        return
+    # refresh the responses that would expire before the next run.
+    calls, failures = await warm_up(
+        warmup_dependencies,
+        concurrency=settings.CACHE_WARMUP_CONCURRENCY,
+        refresh_within=2 * settings.CACHE_WARMUP_INTERVAL,
+    )
+    logger.info(f"Cache prewarmed with {calls} calls, {failures} failed")
+
+
+@app.task("daily")
+async def rotate_request_log_partitions():
+    created, dropped = await maintain_partitions(
+        settings.REQUEST_LOG_RETENTION_MONTHS, settings.REQUEST_LOG_PARTITIONS_AHEAD
+    )
+    logger.info(
+        f"Request log partitions up to {created[-1]} exist, dropped {len(dropped)}"
+    )
+
+
+@app.task("every 5 seconds")
+async def write_streamed_request_logs():
+    if RequestLogSink(settings.REQUEST_LOG_SINK) != RequestLogSink.REDIS:
+        return
+    written = await consume_request_log_stream()
+    if written:
+        logger.info(f"Wrote {written} request logs from the stream")
+
+
+async def main():
+    # connect once, the tasks share the cache client.
+    await init_cache()
+    await app.serve()
+
+
 if __name__ == "__main__":
-    app.run()
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""Measure the cache decorators against the in-memory Redis of `CACHE_ENV=TEST`.
+
+Reports the latency of misses and hits (with and without the local cache), the
+cost of invalidating a namespace and the throughput of concurrent hits, as the
+number of keys per namespace grows. No Redis server is needed, so the numbers
+measure the cache code rather than the network.
+
+Run from the `app` directory:
+
+    python -m benchmarks.bench_cache
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, List
+
+from benchmarks.bench_codecs import get_read_users_response
+from cache import Cache, cache, invalidate
+
+namespace = "bench"
+response = None
+INVALIDATIONS = 10
+
+
+@cache(namespace=namespace, expire=3600, local=False)
+async def read_users(skip: int = 0, limit: int = 10):
+    return response
+
+
+@cache(namespace=namespace, expire=3600)
+async def read_users_local(skip: int = 0, limit: int = 10):
+    return response
+
+
+@invalidate(namespace=namespace)
+async def update_user():
+    return None
+
+
+async def measure(func: Callable[[int], Awaitable], keys: int) -> float:
+    """Call `func` once for each of `keys` keys, return the mean latency in us."""
+    started_at = time.perf_counter()
+    for i in range(keys):
+        await func(i)
+    return (time.perf_counter() - started_at) / keys * 1e6
+
+
+async def measure_throughput(
+    func: Callable[[int], Awaitable], keys: int, concurrency: int
+) -> float:
+    """Call `func` for every key from `concurrency` callers, return calls per second."""
+    queue = list(range(keys))
+
+    async def worker():
+        while queue:
+            await func(queue.pop())
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return keys / (time.perf_counter() - started_at)
+
+
+async def run(key_counts: List[int], users: int, concurrency: int) -> None:
+    redis_cache = Cache()
+    await redis_cache.init(
+        "redis://",
+        prefix="bench",
+        local_cache_size=max(key_counts),
+        health_check_interval=0,
+    )
+    global response
+    response = get_read_users_response(users)
+    # every miss, hit and invalidation is logged, which would be timed too.
+    logging.getLogger("cache.client").setLevel(logging.WARNING)
+    print(
+        f"{'keys':>8}{'miss (us)':>12}{'hit (us)':>12}{'local (us)':>12}"
+        f"{'invalidate (us)':>17}{'hits/s':>12}"
+    )
+    for keys in key_counts:
+        await update_user()
+        miss = await measure(lambda i: read_users(skip=i), keys)
+        hit = await measure(lambda i: read_users(skip=i), keys)
+        # responses are kept in the local cache when they are read from Redis.
+        for _ in range(2):
+            await measure(lambda i: read_users_local(skip=i), keys)
+        local = await measure(lambda i: read_users_local(skip=i), keys)
+        throughput = await measure_throughput(
+            lambda i: read_users(skip=i), keys, concurrency
+        )
+        invalidation = await measure(lambda i: update_user(), INVALIDATIONS)
+        await redis_cache.redis.flushall()
+        print(
+            f"{keys:>8}{miss:>12.1f}{hit:>12.1f}{local:>12.1f}"
+            f"{invalidation:>17.1f}{throughput:>12.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50)
+    options = parser.parse_args()
+
+    os.environ["CACHE_ENV"] = "TEST"
+    asyncio.run(run(options.keys, options.users, options.concurrency))
+
+
+if __name__ == "__main__":
+    main()
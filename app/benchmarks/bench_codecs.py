@@ -0,0 +1,54 @@
+"""Compare the cache codecs on a `read_users`-sized response.
+
+Run from the `app` directory:
+
+    python -m benchmarks.bench_codecs
+"""
+import argparse
+import timeit
+from datetime import datetime, timedelta
+
+from app.models import User
+from app.utils import APIResponse
+from cache.codecs import JsonCodec, MsgpackCodec, OrjsonCodec
+
+
+def get_read_users_response(count: int):
+    created = datetime(2023, 1, 1)
+    users = [
+        User(
+            id=i,
+            full_name=f"user {i}",
+            email=f"user{i}@example.com",
+            hashed_password="$2b$12$" + "x" * 53,
+            is_active=True,
+            is_superuser=i % 10 == 0,
+            created=created + timedelta(minutes=i),
+            modified=created + timedelta(minutes=i),
+        )
+        for i in range(count)
+    ]
+    return APIResponse(users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--number", type=int, default=1000)
+    options = parser.parse_args()
+
+    response = get_read_users_response(options.users)
+    print(f"{'codec':<10}{'bytes':>10}{'encode (us)':>14}{'decode (us)':>14}")
+    for codec in (JsonCodec(), OrjsonCodec(), MsgpackCodec()):
+        data = codec.encode(response)
+        encode = timeit.timeit(lambda: codec.encode(response), number=options.number)
+        decode = timeit.timeit(lambda: codec.decode(data), number=options.number)
+        print(
+            f"{codec.name:<10}{len(data):>10}"
+            f"{encode / options.number * 1e6:>14.1f}"
+            f"{decode / options.number * 1e6:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,17 @@
 # flake8: noqa
+from cache.admission import Quota
+from cache.cache_control import CacheControl
 from cache.cache import (
     cache,
     invalidate,
 )
 from cache.client import Cache
+from cache.codecs import Codec, JsonCodec, MsgpackCodec, OrjsonCodec
+from cache.compression import (
+    Compressor,
+    get_compressor,
+    Lz4Compressor,
+    ZlibCompressor,
+    ZstdCompressor,
+)
+from cache.warmup import warm_up, warmup
@@ -0,0 +1,71 @@
+"""admission.py"""
+from typing import List, NamedTuple
+
+# Counters saturate at this value, as the 4-bit counters of TinyLFU.
+MAX_COUNT = 15
+DEFAULT_SKETCH_WIDTH = 4096
+SKETCH_DEPTH = 4
+
+
+class Quota(NamedTuple):
+    """Limits of the responses a namespace may cache in Redis. 0 is no limit.
+
+    Args:
+        max_keys (int): Number of keys of the current generation of the namespace.
+        max_bytes (int): Total size of the cached values of the current generation.
+        max_payload_bytes (int): Size of a single cached value, larger values are
+            not cached.
+        min_requests (int): Number of times a key must have been requested from the
+            worker before its response is cached, so keys that are rarely reused
+            are not cached.
+    """
+
+    max_keys: int = 0
+    max_bytes: int = 0
+    max_payload_bytes: int = 0
+    min_requests: int = 0
+
+    @property
+    def limits_usage(self) -> bool:
+        return bool(self.max_keys or self.max_bytes)
+
+
+class FrequencySketch:
+    """Count-min sketch that estimates how often keys have been requested.
+
+    Counters saturate at 15 and are halved after `10 * width` increments, so the
+    estimates favour keys that have been requested recently, as in TinyLFU.
+    """
+
+    def __init__(self, width: int = DEFAULT_SKETCH_WIDTH) -> None:
+        self.width = width
+        self.table = [0] * (width * SKETCH_DEPTH)
+        self.sample_size = 10 * width
+        self.additions = 0
+
+    def get_indexes(self, key: str) -> List[int]:
+        # double hashing derives the index of each row from a single hash.
+        h = hash(key)
+        step = (h >> 32) | 1
+        return [
+            row * self.width + (h + row * step) % self.width
+            for row in range(SKETCH_DEPTH)
+        ]
+
+    def increment(self, key: str) -> None:
+        table = self.table
+        for i in self.get_indexes(key):
+            if table[i] < MAX_COUNT:
+                table[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.reset()
+
+    def estimate(self, key: str) -> int:
+        table = self.table
+        return min(table[i] for i in self.get_indexes(key))
+
+    def reset(self) -> None:
+        """Halve every counter, so old requests count less than recent ones."""
+        self.table = [count >> 1 for count in self.table]
+        self.additions //= 2
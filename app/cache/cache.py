@@ -1,27 +1,61 @@
 """cache.py"""
-from ast import pattern
 import asyncio
+import math
+import random
+import time
 from datetime import timedelta
 from functools import partial, update_wrapper, wraps
 from http import HTTPStatus
-from typing import Union
+from inspect import isawaitable, Parameter, Signature, signature
+from typing import Sequence, Type, Union
 
-from fastapi import Response
+from fastapi import BackgroundTasks, Request, Response
+from fastapi.dependencies.utils import get_typed_return_annotation
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.routing import serialize_response
+from fastapi.utils import create_cloned_field, create_response_field
+from pydantic import BaseModel
+from pydantic.fields import ModelField
+from pydantic.utils import lenient_issubclass
+from redis.exceptions import RedisError
+from starlette.exceptions import HTTPException
 
-from cache.client import Cache
+from cache.cache_control import CacheControl
+from cache.client import Cache, JSON_MEDIA_TYPE
+from cache.key_gen import DEFAULT_PRINCIPAL_ARG, get_refresh_key, KeyBuilder
+from cache.local import MISSING
 from cache.util import (
-    deserialize_json,
     ONE_DAY_IN_SECONDS,
     ONE_HOUR_IN_SECONDS,
     ONE_MONTH_IN_SECONDS,
     ONE_WEEK_IN_SECONDS,
     ONE_YEAR_IN_SECONDS,
-    serialize_json,
 )
+from cache.warmup import refresh_window
+
+# Name of the `Response` argument added to cached endpoints that have none.
+CACHE_RESPONSE_ARG = "__cache_response"
+# Errors that mean the resource does not exist, that can be cached negatively.
+NEGATIVE_STATUSES = (HTTPStatus.NOT_FOUND, HTTPStatus.GONE)
 
 
 def cache(
-    *, namespace: str | None = None, expire: int | timedelta = ONE_YEAR_IN_SECONDS
+    *,
+    namespace: str | None = None,
+    expire: int | timedelta = ONE_YEAR_IN_SECONDS,
+    local: bool = True,
+    single_flight: bool = True,
+    lock_timeout: int | float | None = None,
+    stale_ttl: int = 0,
+    early_refresh: float = 0,
+    raw_response: bool = False,
+    vary_on: Sequence[str] = (),
+    principal_arg: str = DEFAULT_PRINCIPAL_ARG,
+    entity: str | None = None,
+    entity_schema: Type[BaseModel] | None = None,
+    write_through: bool = False,
+    cache_control: CacheControl | None = CacheControl(),
+    negative_ttl: int = 0,
 ):
     """Enable caching behavior for the decorated function.
 
@@ -30,73 +64,337 @@ def cache(
             from now when the cached response should expire. Defaults to 31,536,000
             seconds (i.e., the number of seconds in one year).
         namespace (str|None, optional): cache namespace for expiration usage
+        local (bool, optional): serve hits from the in-process cache of the worker
+            when it is enabled in `Cache.init`. Defaults to True.
+        single_flight (bool, optional): when the key is missing, evaluate the
+            decorated function once for all concurrent requests of the worker and
+            share the result. Defaults to True.
+        lock_timeout (int|float|None, optional): lease in seconds of a Redis lock
+            that lets a single worker evaluate a missing key while the others wait
+            for its result. After the lease, waiting workers evaluate the function
+            themselves. Defaults to None (no lock).
+        stale_ttl (int, optional): number of seconds an expired response is still
+            served while it is evaluated again in the background. Defaults to 0.
+        early_refresh (float, optional): XFetch beta factor. When greater than 0,
+            a hit may trigger a background refresh before the response expires,
+            with a probability that grows as expiry approaches and with the time
+            the response took to evaluate. 1.0 is a sensible value, larger values
+            refresh earlier. Defaults to 0 (disabled).
+        raw_response (bool, optional): return the cached bytes in a `Response`,
+            with cache headers, instead of decoding them and letting FastAPI encode
+            them again. The response is validated with the return annotation of the
+            decorated function before it is cached. If the endpoint has a `request`
+            argument, `If-None-Match` requests are answered with 304 Not Modified.
+            Requires a JSON codec. Defaults to False.
+        vary_on (Sequence[str], optional): request properties the response depends
+            on, that are added to the cache key: "principal" (the id of the
+            caller), "role" (whether the caller is a superuser) and
+            "header:<name>" (the value of a request header). Defaults to ().
+        principal_arg (str, optional): name of the argument of the decorated
+            function that holds the caller. Defaults to "current_user".
+        entity (str|None, optional): type of the entities (such as "user") the
+            decorated function returns, alone, in a list or in an `APIResponse`.
+            The response is cached with the ids of the entities, and the entities
+            are cached separately, where they are shared with every other response
+            of the namespace that holds them. Hits read the response and its
+            entities in a single round trip. Can not be combined with
+            `raw_response`. Defaults to None.
+        entity_schema (Type[BaseModel]|None, optional): schema of the entities,
+            only its fields are cached. Defaults to None (every column).
+        write_through (bool, optional): when an entity of the response is changed
+            through `CRUDBase`, cache its new value (with `entity_schema`) instead
+            of evicting it, so the responses that hold it are still hits after the
+            write. Requires `entity`. Defaults to False.
+        cache_control (CacheControl|None, optional): HTTP caching policy of the
+            responses. The `Cache-Control`, `Expires`, `Age`, `Vary` and (when it is
+            known) `ETag` headers let clients and shared caches reuse a response
+            until it expires in Redis. Responses are private unless the policy
+            sets `private=False`. None only sets the hit or miss header. Defaults
+            to `CacheControl()`.
+        negative_ttl (int, optional): number of seconds a 404 (or 410) response is
+            cached, as rendered by the exception handler of the application, so
+            repeated requests for a missing resource do not reach the database.
+            It is only read when the response is not cached, and with `entity`, it
+            is evicted when an entity of that type is created. Requires a `request`
+            argument. Defaults to 0 (disabled).
     """
 
+    if entity and raw_response:
+        raise ValueError("raw_response can not be combined with entity")
+    if write_through and not entity:
+        raise ValueError("write_through requires entity")
+    cache_ttl = calculate_ttl(expire)
+    if cache_control is not None:
+        cache_control = cache_control.resolve(vary_on, stale_ttl)
+
     def outer_wrapper(func):
+        response_field = get_response_field(func) if raw_response else None
+        # the headers are set on the `Response` FastAPI injects into the endpoint.
+        response_arg = get_response_arg(func)
+        if negative_ttl and "request" not in signature(func).parameters:
+            raise ValueError(
+                f"{func.__name__} must have a 'request' argument to cache errors"
+            )
+        key_builder = KeyBuilder(func, vary_on, principal_arg)
+        Cache().register_namespace(namespace)
+        if entity:
+            Cache().register_entity(
+                entity,
+                namespace,
+                entity_schema,
+                cache_ttl + stale_ttl if write_through else None,
+            )
+
         @wraps(func)
         async def inner_wrapper(*args, **kwargs):
             """Return cached value if one exists, otherwise evaluate the wrapped function and cache the result."""
 
-            func_kwargs = kwargs.copy()
-            request = func_kwargs.pop("request", None)
-            response = func_kwargs.pop("response", None)
-            create_response_directly = not response
-            if create_response_directly:
-                response = Response()
+            request = kwargs.get("request")
+            if response_arg:
+                response = kwargs.get(response_arg)
+            else:
+                response = kwargs.pop(CACHE_RESPONSE_ARG, None)
             redis_cache = Cache()
-            if redis_cache.not_connected or redis_cache.request_is_not_cacheable(
-                request
+            # the circuit breaker is only asked for requests that would use Redis.
+            if (
+                redis_cache.request_is_not_cacheable(request)
+                or not redis_cache.allow_request()
             ):
                 # if the redis client is not connected or request is not cacheable, no caching behavior is performed.
+                redis_cache.metrics.incr(namespace, "bypasses")
+                return await get_api_response_async(func, *args, **kwargs)
+            # cached bytes can only be returned as they are if they are JSON.
+            raw = raw_response and redis_cache.codec.media_type == JSON_MEDIA_TYPE
+            key = redis_cache.get_cache_key(key_builder, namespace, *args, **kwargs)
+            redis_cache.frequency.increment(key)
+            window = refresh_window.get()
+            # the warmup reads the keys from Redis, to see when they expire.
+            use_local = local and redis_cache.local and window is None
+
+            def respond(
+                response_data, cache_hit: bool, ttl: int, etag=None, stored=True
+            ):
+                """Return the response with the HTTP caching headers, `ttl` is the
+                number of seconds it is still fresh in the cache.
+
+                Responses that were not `stored` in the cache must not be stored by
+                clients either.
+                """
+                age = max(cache_ttl - ttl, 0)
+                ttl = max(ttl, 0)
+                control = cache_control
+                if not stored and control is not None:
+                    control = control._replace(no_store=True)
+                if raw:
+                    return redis_cache.get_cached_response(
+                        request,
+                        response_data,
+                        etag,
+                        ttl,
+                        cache_hit,
+                        age=age,
+                        cache_control=control,
+                    )
+                if redis_cache.requested_resource_not_modified(request, etag):
+                    not_modified = Response(status_code=HTTPStatus.NOT_MODIFIED)
+                    redis_cache.set_response_headers(
+                        not_modified, cache_hit, etag, ttl, age, control
+                    )
+                    return not_modified
+                if response is not None:
+                    redis_cache.set_response_headers(
+                        response, cache_hit, etag, ttl, age, control
+                    )
+                return response_data
+
+            if use_local:
+                ttl, in_cache = redis_cache.check_local_cache(key, namespace)
+                if in_cache is not MISSING:
+                    # responses are kept locally with their ETag.
+                    return respond(in_cache[0], True, ttl, in_cache[1])
+                epoch = redis_cache.local.get_epoch(str(namespace))
+            try:
+                if entity:
+                    (
+                        versioned_key,
+                        ttl,
+                        in_cache,
+                        delta,
+                        etag,
+                    ) = await redis_cache.check_entities(namespace, key, entity)
+                else:
+                    (
+                        versioned_key,
+                        ttl,
+                        in_cache,
+                        delta,
+                        etag,
+                    ) = await redis_cache.check_cache(namespace, key)
+            except RedisError as e:
+                redis_cache.record_failure(e, key=key, namespace=namespace)
+                redis_cache.metrics.incr(namespace, "bypasses")
                 return await get_api_response_async(func, *args, **kwargs)
-            key = redis_cache.get_cache_key(func, namespace, *args, **kwargs)
-            ttl, in_cache = await redis_cache.check_cache(key)
+            redis_cache.record_success()
+
+            def decode(in_cache):
+                if entity:
+                    return redis_cache.decode_entities(in_cache, namespace)
+                return redis_cache.decode(in_cache, namespace)
+
+            async def evaluate(wait: bool = True):
+                token = None
+                if lock_timeout:
+                    try:
+                        token = await redis_cache.acquire_lock(
+                            versioned_key, lock_timeout
+                        )
+                        if not token and not wait:
+                            return None, False
+                        if not token:
+                            # another worker is evaluating this key, wait for its
+                            # result.
+                            in_cache, etag = await redis_cache.wait_for_key(
+                                versioned_key, lock_timeout
+                            )
+                            if in_cache and entity:
+                                (
+                                    _,
+                                    _,
+                                    in_cache,
+                                    _,
+                                    etag,
+                                ) = await redis_cache.check_entities(
+                                    namespace, key, entity
+                                )
+                            if in_cache:
+                                if raw:
+                                    return (in_cache, etag), True
+                                return (decode(in_cache), etag), True
+                    except RedisError as e:
+                        # evaluate the function without the lock.
+                        redis_cache.record_failure(
+                            e, key=versioned_key, namespace=namespace
+                        )
+                try:
+                    started_at = time.monotonic()
+                    response_data = await get_api_response_async(func, *args, **kwargs)
+                    etag = None
+                    if raw:
+                        response_data = Response(
+                            content=await encode_response(
+                                redis_cache, response_field, response_data
+                            ),
+                            media_type=JSON_MEDIA_TYPE,
+                        )
+                        etag = redis_cache.get_etag(response_data.body)
+                    if entity:
+                        cached_etag = await redis_cache.add_entities_to_cache(
+                            versioned_key,
+                            response_data,
+                            cache_ttl + stale_ttl,
+                            entity,
+                            entity_schema,
+                            delta=time.monotonic() - started_at,
+                            namespace=namespace,
+                        )
+                    else:
+                        cached_etag = await redis_cache.add_to_cache(
+                            versioned_key,
+                            response_data,
+                            cache_ttl + stale_ttl,
+                            delta=time.monotonic() - started_at,
+                            etag=etag,
+                            namespace=namespace,
+                        )
+                    cached = cached_etag is not None
+                    if raw:
+                        # share the body, each request builds its own response.
+                        return (response_data.body, etag), cached
+                    return (response_data, cached_etag), cached
+                finally:
+                    if token:
+                        await redis_cache.release_lock(versioned_key, token)
+
             if in_cache:
-                return deserialize_json(in_cache)
-                redis_cache.set_response_headers(
-                    response, True, deserialize_json(in_cache), ttl
-                )
-                if redis_cache.requested_resource_not_modified(request, in_cache):
-                    response.status_code = int(HTTPStatus.NOT_MODIFIED)
-                    return (
-                        Response(
-                            content=None,
-                            status_code=response.status_code,
-                            media_type="application/json",
-                            headers=response.headers,
+                if raw:
+                    response_data = (in_cache, etag)
+                else:
+                    response_data = decode(in_cache)
+                # the key is kept `stale_ttl` seconds longer than `expire`.
+                fresh_ttl = ttl - stale_ttl
+                refresh_key = get_refresh_key(versioned_key)
+                if window is not None:
+                    if fresh_ttl <= window and refresh_key not in (
+                        redis_cache.single_flight
+                    ):
+                        await redis_cache.single_flight.do(
+                            refresh_key, partial(evaluate, wait=False)
                         )
-                        if create_response_directly
-                        else response
+                    return response_data
+                if refresh_key not in redis_cache.single_flight and needs_refresh(
+                    fresh_ttl, delta, early_refresh
+                ):
+                    redis_cache.run_in_background(
+                        versioned_key,
+                        partial(
+                            redis_cache.single_flight.do,
+                            refresh_key,
+                            partial(evaluate, wait=False),
+                        ),
+                        background_tasks=get_background_tasks(kwargs),
                     )
-                return (
-                    Response(
-                        content=in_cache,
-                        media_type="application/json",
-                        headers=response.headers,
+                if use_local:
+                    redis_cache.local.set(
+                        key,
+                        str(namespace),
+                        response_data if raw else (response_data, etag),
+                        fresh_ttl,
+                        epoch=epoch,
                     )
-                    if create_response_directly
-                    else deserialize_json(in_cache)
+                return respond(
+                    in_cache if raw else response_data, True, fresh_ttl, etag
                 )
-            response_data = await get_api_response_async(func, *args, **kwargs)
-            ttl = calculate_ttl(expire)
-            
-            cached = await redis_cache.add_to_cache(key, response_data, ttl)
-            return response_data
-            if cached:
-                redis_cache.set_response_headers(
-                    response, cache_hit=False, response_data=response_data, ttl=ttl
-                )
-                return (
-                    Response(
-                        content=serialize_json(response_data),
-                        media_type="application/json",
-                        headers=response.headers,
+            if negative_ttl:
+                try:
+                    ttl, error_response = await redis_cache.check_negative(
+                        versioned_key, namespace
                     )
-                    if create_response_directly
-                    else response_data
+                except RedisError as e:
+                    redis_cache.record_failure(e, key=key, namespace=namespace)
+                    ttl, error_response = 0, None
+                if error_response is not None:
+                    redis_cache.set_response_headers(
+                        error_response,
+                        True,
+                        ttl=ttl,
+                        age=max(negative_ttl - ttl, 0),
+                        cache_control=cache_control,
+                    )
+                    return error_response
+            try:
+                if single_flight:
+                    # concurrent misses of the same key in this worker share one
+                    # evaluation.
+                    (response_data, etag), cached = await redis_cache.single_flight.do(
+                        versioned_key, evaluate
+                    )
+                else:
+                    (response_data, etag), cached = await evaluate()
+            except HTTPException as e:
+                if not negative_ttl or e.status_code not in NEGATIVE_STATUSES:
+                    raise
+                error_response = await render_exception(request, e)
+                await redis_cache.add_negative_to_cache(
+                    versioned_key, error_response, negative_ttl, entity, namespace
                 )
-            return response_data
+                redis_cache.set_response_headers(
+                    error_response, False, ttl=negative_ttl, cache_control=cache_control
+                )
+                return error_response
+            return respond(response_data, False, cache_ttl, etag, stored=cached)
 
+        if not response_arg:
+            inner_wrapper.__signature__ = add_response_param(func)
         return inner_wrapper
 
     return outer_wrapper
@@ -112,13 +410,10 @@ def invalidate(*, namespace: str | None = None):
     def outer_wrapper(func):
         @wraps(func)
         async def inner_wrapper(*args, **kwargs):
-            """delete cached namespace."""
-            redis_cache = Cache()
-            if redis_cache.connected:
-                # if the redis client is not connected no caching behavior is performed.
-                pattern = redis_cache.get_cache_key_pattern(namespace)
-                await redis_cache.invalidate(pattern)
-            return await get_api_response_async(func, *args, **kwargs)
+            """invalidate cached namespace once the decorated function succeeds."""
+            response_data = await get_api_response_async(func, *args, **kwargs)
+            await Cache().invalidate_or_defer(namespace)
+            return response_data
 
         return inner_wrapper
 
@@ -134,6 +429,90 @@ async def get_api_response_async(func, *args, **kwargs):
     )
 
 
+def needs_refresh(fresh_ttl: int, delta: float, early_refresh: float) -> bool:
+    """Decide whether a cached response should be evaluated again in the background.
+
+    Stale responses are always refreshed. Fresh responses are refreshed early with
+    the XFetch probability: `delta * early_refresh * -log(rand()) >= fresh_ttl`.
+    """
+    if fresh_ttl <= 0:
+        return True
+    if not early_refresh or not delta:
+        return False
+    return delta * early_refresh * -math.log(1.0 - random.random()) >= fresh_ttl
+
+
+def get_response_field(func) -> ModelField | None:
+    """Create the field FastAPI uses to validate the return annotation of `func`."""
+    return_annotation = get_typed_return_annotation(func)
+    if return_annotation is None or lenient_issubclass(return_annotation, Response):
+        return None
+    return create_cloned_field(
+        create_response_field(name=f"Response_{func.__name__}", type_=return_annotation)
+    )
+
+
+async def encode_response(
+    redis_cache: Cache, response_field: ModelField | None, response_data
+) -> bytes:
+    """Encode `response_data` to the body FastAPI would send for it."""
+    if isinstance(response_data, Response):
+        return response_data.body
+    if response_field:
+        response_data = await serialize_response(
+            field=response_field, response_content=response_data
+        )
+    return redis_cache.codec.encode(response_data)
+
+
+def get_response_arg(func) -> str | None:
+    """Return the name of the argument of `func` FastAPI injects a `Response` into."""
+    return next(
+        (
+            name
+            for name, param in signature(func).parameters.items()
+            if lenient_issubclass(param.annotation, Response)
+        ),
+        None,
+    )
+
+
+def add_response_param(func) -> Signature:
+    """Return the signature of `func` with an extra `Response` argument, so FastAPI
+    injects one into the cached endpoint to set the headers of the response.
+    """
+    sig = signature(func)
+    params = list(sig.parameters.values())
+    param = Parameter(CACHE_RESPONSE_ARG, Parameter.KEYWORD_ONLY, annotation=Response)
+    if params and params[-1].kind == Parameter.VAR_KEYWORD:
+        params.insert(-1, param)
+    else:
+        params.append(param)
+    return sig.replace(parameters=params)
+
+
+async def render_exception(request: Request, exc: Exception) -> Response:
+    """Render `exc` with the exception handler of the application, as FastAPI would
+    if it was raised by the endpoint.
+    """
+    handlers = request.app.exception_handlers
+    handler = handlers.get(getattr(exc, "status_code", None)) or next(
+        (handlers[cls] for cls in type(exc).__mro__ if cls in handlers),
+        http_exception_handler,
+    )
+    response = handler(request, exc)
+    if isawaitable(response):
+        response = await response
+    return response
+
+
+def get_background_tasks(kwargs: dict) -> BackgroundTasks | None:
+    """Return the `BackgroundTasks` injected into the endpoint, if any."""
+    return next(
+        (arg for arg in kwargs.values() if isinstance(arg, BackgroundTasks)), None
+    )
+
+
 def calculate_ttl(expire: Union[int, timedelta]) -> int:
     """ "Converts expire time to total seconds and ensures that ttl is capped at one year."""
     if isinstance(expire, timedelta):
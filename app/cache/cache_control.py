@@ -0,0 +1,92 @@
+"""cache_control.py"""
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+from cache.key_gen import VARY_ON_HEADER_PREFIX, VARY_ON_PRINCIPAL, VARY_ON_ROLE
+
+# Responses that vary on the caller are identified by its credentials.
+AUTHORIZATION_HEADER = "Authorization"
+
+
+class CacheControl(NamedTuple):
+    """HTTP caching policy of the responses of a cached endpoint.
+
+    Clients and shared caches (such as a CDN or nginx) may reuse a response until it
+    expires in Redis, or for at most `max_age` seconds.
+
+    Args:
+        max_age (int, optional): Maximum number of seconds a client may reuse the
+            response. Defaults to None (until it expires in Redis).
+        s_maxage (int, optional): Maximum number of seconds a shared cache may reuse
+            the response, if it differs from `max_age`. Only sent for public
+            responses. Defaults to None.
+        private (bool, optional): Whether the response may only be stored by the
+            client, not by shared caches. Defaults to True, since an endpoint may
+            require authentication without varying on the caller: pass False for
+            responses that are the same for every client.
+        stale_while_revalidate (int, optional): Number of seconds a stale response
+            may be reused while it is revalidated. Defaults to None (the
+            `stale_ttl` of the endpoint).
+        vary (Tuple[str, ...], optional): Request headers the response depends on.
+            Defaults to () (derived from the `vary_on` of the endpoint).
+        no_cache (bool, optional): Whether clients must revalidate the response
+            (with its ETag) before reusing it. Defaults to False.
+        no_store (bool, optional): Whether the response may not be stored at all.
+            Defaults to False.
+    """
+
+    max_age: Optional[int] = None
+    s_maxage: Optional[int] = None
+    private: bool = True
+    stale_while_revalidate: Optional[int] = None
+    vary: Tuple[str, ...] = ()
+    no_cache: bool = False
+    no_store: bool = False
+
+    def resolve(self, vary_on: Sequence[str], stale_ttl: int = 0) -> "CacheControl":
+        """Fill in the defaults that depend on the options of the endpoint."""
+        varies_on_caller = VARY_ON_PRINCIPAL in vary_on or VARY_ON_ROLE in vary_on
+        vary = list(self.vary)
+        if varies_on_caller:
+            vary.append(AUTHORIZATION_HEADER)
+        vary.extend(
+            option.partition(":")[2]
+            for option in vary_on
+            if option.startswith(VARY_ON_HEADER_PREFIX)
+        )
+        return self._replace(
+            stale_while_revalidate=(
+                stale_ttl
+                if self.stale_while_revalidate is None
+                else self.stale_while_revalidate
+            ),
+            vary=tuple(dict.fromkeys(vary)),
+        )
+
+    def get_max_age(self, ttl: int) -> int:
+        """Number of seconds the response may still be reused, `ttl` is the number
+        of seconds it is still fresh in Redis.
+        """
+        if self.no_cache or self.no_store:
+            return 0
+        return ttl if self.max_age is None else min(ttl, self.max_age)
+
+    def get_header(self, ttl: int, age: int = 0) -> str:
+        """Return the `Cache-Control` header of a response that is still fresh for
+        `ttl` seconds and was cached `age` seconds ago.
+
+        The lifetimes count from when the response was cached, since clients
+        subtract its `Age` from them.
+        """
+        if self.no_store:
+            return "no-store"
+        if self.no_cache:
+            return f"{'private' if self.private else 'public'}, no-cache"
+        directives = [
+            "private" if self.private else "public",
+            f"max-age={age + self.get_max_age(ttl)}",
+        ]
+        if self.s_maxage is not None and not self.private:
+            directives.append(f"s-maxage={age + min(ttl, self.s_maxage)}")
+        if self.stale_while_revalidate:
+            directives.append(f"stale-while-revalidate={self.stale_while_revalidate}")
+        return ", ".join(directives)
@@ -0,0 +1,51 @@
+"""circuit_breaker.py"""
+import time
+from enum import IntEnum
+
+
+class CircuitState(IntEnum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker:
+    """Stop sending requests to Redis while it is failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests
+    bypass the cache without waiting for a timeout. After `reset_timeout` seconds
+    a single request is let through: the circuit closes if it succeeds and opens
+    again if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow_request(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        # let one request through, the others bypass the cache until it completes.
+        self.state = CircuitState.HALF_OPEN
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> bool:
+        """Count a failure, return True if it opened the circuit."""
+        self.failures += 1
+        if self.state == CircuitState.OPEN or (
+            self.state == CircuitState.CLOSED and self.failures < self.failure_threshold
+        ):
+            return False
+        self.state = CircuitState.OPEN
+        self.opened_at = time.monotonic()
+        return True
@@ -1,22 +1,269 @@
+import asyncio
 import json
 import logging
+import os
+import socket
+import time
+from uuid import uuid4
 from datetime import datetime, timedelta
-from typing import Callable, Dict, List, Optional, Tuple, Type, Union
+from http import HTTPStatus
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
-from fastapi import Request, Response
+from fastapi import BackgroundTasks, Request, Response
+from pydantic import BaseModel
 from redis.asyncio import client
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
 
+from cache.admission import DEFAULT_SKETCH_WIDTH, FrequencySketch, Quota
+from cache.cache_control import CacheControl
+from cache.circuit_breaker import CircuitBreaker
+from cache.codecs import Codec, JsonCodec
+from cache.compression import compress, Compressor, decompress, store_uncompressed
 from cache.enums import RedisEvent, RedisStatus
-from cache.key_gen import get_cache_key, get_cache_key_pattern
+from cache.entities import (
+    dump_entity,
+    get_entity_id,
+    ID_SEPARATOR,
+    join_entities,
+    split_entities,
+)
+from cache.key_gen import (
+    get_entity_key_prefix,
+    get_entity_lists_key,
+    get_entity_missing_key,
+    get_entity_writes_key,
+    get_lock_key,
+    get_negative_key,
+    get_namespace_version_key,
+    get_versioned_key,
+    KeyBuilder,
+    VERSION_SEPARATOR,
+)
+from cache.local import LocalCache, MISSING
+from cache.metrics import CacheMetrics
 from cache.redis import redis_connect
-from cache.util import serialize_json
+from cache.single_flight import SingleFlight
+from cache.util import get_digest, serialize_json
 
 DEFAULT_RESPONSE_HEADER = "X-FastAPI-Cache"
 ALLOWED_HTTP_TYPES = ["GET"]
+JSON_MEDIA_TYPE = "application/json"
 LOG_TIMESTAMP = "%m/%d/%Y %I:%M:%S %p"
+INVALIDATION_CHANNEL = "invalidate"
+METRICS_KEY = "metrics"
+USAGE_KEY = "usage"
+# Metrics of workers that have not published them for this many intervals are
+# dropped, the worker has probably stopped.
+METRICS_STALE_INTERVALS = 3
+RESUBSCRIBE_DELAY = 1
+LOCK_POLL_INTERVAL = 0.05
 HTTP_TIME = "%a, %d %b %Y %H:%M:%S GMT"
 
-logging.basicConfig()
+# Resolve the current generation of the namespace and read the versioned key in a
+# single round trip. The versioned key is derived inside the script, so it is not
+# declared in KEYS; this is fine for a standalone Redis server.
+CHECK_CACHE_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+local key = ARGV[1] .. ARGV[2] .. version
+local ok, fields = pcall(redis.call, 'HMGET', key, 'value', 'delta', 'etag')
+if not ok then
+    -- the key holds a value in a previous format, treat it as a miss.
+    fields = {false, false, false}
+end
+return {key, redis.call('TTL', key), fields[1], fields[2], fields[3]}
+"""
+
+# Read a response that was cached with its entities replaced by their ids, its ETag,
+# the entities and the token of the last write-through of an entity of its type
+# ARGV[4], in a single round trip. The entities are stored once per generation of
+# the namespace, and shared by every response that holds them.
+CHECK_ENTITIES_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+local key = ARGV[1] .. ARGV[2] .. version
+local ok, fields = pcall(redis.call, 'HMGET', key, 'value', 'delta', 'ids', 'etag')
+if not ok then
+    fields = {false, false, false, false}
+end
+local entities = {}
+if fields[3] and fields[3] ~= '' then
+    local keys = {}
+    for id in string.gmatch(fields[3], '[^,]+') do
+        keys[#keys + 1] = ARGV[3] .. id .. ARGV[2] .. version
+    end
+    -- unpack is table.unpack after Lua 5.1.
+    entities = redis.call('MGET', (unpack or table.unpack)(keys))
+end
+local writes = redis.call('GET', ARGV[4] .. ARGV[2] .. version)
+return {key, redis.call('TTL', key), fields[1], fields[2], entities, fields[4], writes}
+"""
+
+# Usage of a generation of a namespace: the hash `usage` holds the number of keys and
+# bytes cached, and the keys that were rejected. Each counted key is in the sorted set
+# `usage:expiries`, scored by the time it expires, and its size is in the hash
+# `usage:sizes`, so the usage shrinks again when keys expire, are replaced or are
+# evicted.
+USAGE_FUNCTIONS = """
+local function release(usage, key)
+    local size = redis.call('HGET', usage .. ':sizes', key)
+    if size then
+        redis.call('HINCRBY', usage, 'keys', -1)
+        redis.call('HINCRBY', usage, 'bytes', -tonumber(size))
+        redis.call('HDEL', usage .. ':sizes', key)
+        redis.call('ZREM', usage .. ':expiries', key)
+    end
+end
+
+local function release_expired(usage, now)
+    local expired = redis.call(
+        'ZRANGEBYSCORE', usage .. ':expiries', '-inf', now, 'LIMIT', 0, 1000
+    )
+    for _, key in ipairs(expired) do
+        release(usage, key)
+    end
+end
+
+local function count(usage, key, size, expires_at)
+    release(usage, key)
+    redis.call('HINCRBY', usage, 'keys', 1)
+    redis.call('HINCRBY', usage, 'bytes', size)
+    redis.call('HSET', usage .. ':sizes', key, size)
+    redis.call('ZADD', usage .. ':expiries', expires_at, key)
+end
+
+-- the usage expires with the longest lived key it counts.
+local function keep(usage, expire)
+    for _, key in ipairs({usage, usage .. ':sizes', usage .. ':expiries'}) do
+        if redis.call('TTL', key) < expire then
+            redis.call('EXPIRE', key, expire)
+        end
+    end
+end
+"""
+
+# Evict an entity, which turns every response that holds it into a miss, and the
+# responses in the set of list responses ARGV[3] and the set of error responses of
+# missing entities ARGV[6], if given, under the current generation of the namespace.
+# If the new value of the entity is given in ARGV[4], it replaces the cached entity
+# for ARGV[5] seconds instead, so the responses that hold it stay cached, and their
+# ETag changes with the token ARGV[10] of the write stored in ARGV[9]. The usage
+# ARGV[7] of the namespace is updated at time ARGV[8].
+INVALIDATE_ENTITY_SCRIPT = (
+    USAGE_FUNCTIONS
+    + """
+local version = redis.call('GET', KEYS[1]) or '0'
+local suffix = ARGV[1] .. version
+local usage = ARGV[7] .. suffix
+local now = tonumber(ARGV[8])
+local evicted = 0
+if ARGV[2] ~= '' and ARGV[4] ~= '' then
+    redis.call('SET', ARGV[2] .. suffix, ARGV[4], 'EX', ARGV[5])
+    count(usage, ARGV[2] .. suffix, string.len(ARGV[4]), now + tonumber(ARGV[5]))
+    keep(usage, tonumber(ARGV[5]))
+    redis.call('SET', ARGV[9] .. suffix, ARGV[10], 'EX', ARGV[5])
+elseif ARGV[2] ~= '' then
+    evicted = evicted + redis.call('DEL', ARGV[2] .. suffix)
+    release(usage, ARGV[2] .. suffix)
+end
+for _, set_key in ipairs({ARGV[3], ARGV[6]}) do
+    if set_key ~= '' then
+        set_key = set_key .. suffix
+        for _, key in ipairs(redis.call('SMEMBERS', set_key)) do
+            evicted = evicted + redis.call('DEL', key)
+            release(usage, key)
+        end
+        redis.call('DEL', set_key)
+    end
+end
+return evicted
+"""
+)
+
+# Count the keys KEYS[2..] of ARGV[5..] bytes in the usage KEYS[1] of a namespace at
+# time ARGV[4], unless it would exceed the quota of ARGV[1] keys or ARGV[2] bytes (0 is
+# no limit). Returns 1 if the keys may be cached for ARGV[3] seconds. A key that is
+# already counted is replaced, only the change of its size is counted.
+UPDATE_USAGE_SCRIPT = (
+    USAGE_FUNCTIONS
+    + """
+local usage = KEYS[1]
+local max_keys = tonumber(ARGV[1])
+local max_bytes = tonumber(ARGV[2])
+local expire = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+release_expired(usage, now)
+local values = redis.call('HMGET', usage, 'keys', 'bytes')
+local keys = tonumber(values[1] or '0')
+local bytes = tonumber(values[2] or '0')
+for i = 2, #KEYS do
+    local size = redis.call('HGET', usage .. ':sizes', KEYS[i])
+    if size then
+        bytes = bytes - tonumber(size)
+    else
+        keys = keys + 1
+    end
+    bytes = bytes + tonumber(ARGV[i + 3])
+end
+if (max_keys > 0 and keys > max_keys) or (max_bytes > 0 and bytes > max_bytes) then
+    redis.call('HINCRBY', usage, 'rejected', 1)
+    return 0
+end
+for i = 2, #KEYS do
+    count(usage, KEYS[i], tonumber(ARGV[i + 3]), now + expire)
+end
+keep(usage, expire)
+return 1
+"""
+)
+
+# Read the usage of the current generation of the namespace at time ARGV[3].
+GET_USAGE_SCRIPT = (
+    USAGE_FUNCTIONS
+    + """
+local version = redis.call('GET', KEYS[1]) or '0'
+local usage = ARGV[1] .. ARGV[2] .. version
+release_expired(usage, tonumber(ARGV[3]))
+return redis.call('HGETALL', usage)
+"""
+)
+
+# Only the owner of a lock (identified by its token) may release it.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Events logged on every request are only logged at the DEBUG level, the metrics
+# of the cache count them.
+EVENT_LOG_LEVELS = {
+    RedisEvent.KEY_ADDED_TO_CACHE: logging.DEBUG,
+    RedisEvent.KEY_FOUND_IN_CACHE: logging.DEBUG,
+    RedisEvent.KEY_FOUND_IN_LOCAL_CACHE: logging.DEBUG,
+    RedisEvent.KEY_LOCKED: logging.DEBUG,
+    RedisEvent.KEY_REJECTED: logging.DEBUG,
+    RedisEvent.CONNECT_FAIL: logging.WARNING,
+    RedisEvent.FAILED_TO_CACHE_KEY: logging.WARNING,
+    RedisEvent.SUBSCRIPTION_FAIL: logging.WARNING,
+    RedisEvent.REQUEST_FAILED: logging.WARNING,
+    RedisEvent.CIRCUIT_OPENED: logging.WARNING,
+}
+
+logging.basicConfig(
+    format="%(levelname)s:%(name)s: %(asctime)s | %(message)s", datefmt=LOG_TIMESTAMP
+)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -40,9 +287,42 @@ class Cache(metaclass=MetaSingleton):
     response_header: str = None
     status: RedisStatus = RedisStatus.NONE
     redis: client.Redis = None
+    codec: Codec = JsonCodec()
+    compressor: Compressor = None
+    compression_threshold: int = 1024
+    check_cache_script = None
+    check_entities_script = None
+    invalidate_entity_script = None
+    entity_namespaces: Dict[str, Set[str]] = {}
+    # namespaces whose invalidation couldn't be delivered, invalidated once Redis is
+    # reachable again.
+    pending_invalidations: Set[str] = set()
+    # schema and expiry of the entities written through, by entity and namespace.
+    write_through_entities: Dict[str, Dict[str, Tuple[Any, int]]] = {}
+    release_lock_script = None
+    update_usage_script = None
+    get_usage_script = None
+    # namespaces of the cached functions, and the quotas that differ from `quota`.
+    namespaces: Set[str] = set()
+    quota: Quota = Quota()
+    quotas: Dict[str, Quota] = {}
+    frequency: FrequencySketch = FrequencySketch()
+    single_flight: SingleFlight = SingleFlight()
+    background_tasks: Set[asyncio.Task] = set()
+    local: LocalCache = None
+    invalidation_listener: asyncio.Task = None
+    circuit_breaker: CircuitBreaker = CircuitBreaker()
+    connection_options: Dict[str, Any] = {}
+    health_check_interval: float = 5
+    health_monitor: asyncio.Task = None
+    metrics: CacheMetrics = CacheMetrics()
+    metrics_interval: float = 10
+    metrics_publisher: asyncio.Task = None
+    worker_id: str = f"{socket.gethostname()}:{os.getpid()}"
 
     @property
     def connected(self):
+        """True if Redis was reachable at the last health check."""
         return self.status == RedisStatus.CONNECTED
 
     @property
@@ -55,6 +335,19 @@ class Cache(metaclass=MetaSingleton):
         prefix: Optional[str] = None,
         response_header: Optional[str] = None,
         ignore_arg_types: Optional[List[Type[object]]] = None,
+        local_cache_size: int = 0,
+        local_cache_ttl: int = 60,
+        codec: Optional[Codec] = None,
+        compressor: Optional[Compressor] = None,
+        compression_threshold: int = 1024,
+        max_connections: int = 50,
+        timeout: Optional[float] = None,
+        pool_timeout: Optional[float] = None,
+        health_check_interval: float = 5,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10,
+        metrics_interval: float = 10,
+        quota: Optional[Quota] = None,
     ) -> None:
         """Connect to a Redis database using `host_url` and configure cache settings.
 
@@ -69,19 +362,88 @@ class Cache(metaclass=MetaSingleton):
                 are any arguments that have no effect on the response (such as a
                 `Request` or `Response` object), including their type in this list
                 will ignore those arguments when the key is created. Defaults to None.
+            local_cache_size (int, optional): Maximum number of responses kept in the
+                in-process cache of each worker. Defaults to 0 (disabled).
+            local_cache_ttl (int, optional): Maximum number of seconds a response is
+                kept in the in-process cache. Defaults to 60.
+            codec (Codec, optional): Encodes response data to the bytes stored in
+                Redis and decodes it back. Defaults to `JsonCodec()`.
+            compressor (Compressor, optional): Compresses values larger than
+                `compression_threshold` bytes before they are stored in Redis.
+                Defaults to None (disabled).
+            compression_threshold (int, optional): Minimum size in bytes of the
+                values that are compressed. Defaults to 1024.
+            max_connections (int, optional): Size of the Redis connection pool of the
+                worker. Defaults to 50.
+            timeout (float, optional): Seconds to wait to connect to Redis and for
+                the reply to a command. Defaults to None (no timeout).
+            pool_timeout (float, optional): Seconds to wait for a free connection
+                when the pool is exhausted. Defaults to None (no timeout).
+            health_check_interval (float, optional): Seconds between the pings that
+                detect that Redis is down or has recovered, and reconnect to it. 0
+                disables the health checks. Defaults to 5.
+            failure_threshold (int, optional): Number of consecutive failed Redis
+                requests after which the cache is bypassed. Defaults to 5.
+            reset_timeout (float, optional): Seconds to bypass the cache before a
+                request is sent to Redis again. Defaults to 10.
+            metrics_interval (float, optional): Seconds between the publications of
+                the metrics of the worker to Redis, where they are aggregated with
+                the metrics of the other workers. 0 disables the publication.
+                Defaults to 10.
+            quota (Quota, optional): Limits of the keys each namespace caches in
+                Redis, unless `set_quota` gives the namespace its own. Defaults to
+                None (no limits).
         """
         self.host_url = host_url
         self.prefix = prefix
         self.response_header = response_header or DEFAULT_RESPONSE_HEADER
         self.ignore_arg_types = ignore_arg_types
+        self.codec = codec or JsonCodec()
+        self.compressor = compressor
+        self.compression_threshold = compression_threshold
+        self.connection_options = {
+            "max_connections": max_connections,
+            "timeout": timeout,
+            "pool_timeout": pool_timeout,
+        }
+        self.health_check_interval = health_check_interval
+        self.circuit_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.quota = quota or Quota()
+        self.frequency = FrequencySketch(max(local_cache_size, DEFAULT_SKETCH_WIDTH))
+        if local_cache_size > 0:
+            self.local = LocalCache(
+                maxsize=local_cache_size, ttl=local_cache_ttl, sketch=self.frequency
+            )
         await self._connect()
+        if self.health_check_interval > 0:
+            self.health_monitor = asyncio.create_task(self._monitor_health())
+        self.metrics_interval = metrics_interval
+        if self.metrics_interval > 0:
+            self.metrics_publisher = asyncio.create_task(self._publish_metrics())
 
     async def _connect(self):
         self.log(
             RedisEvent.CONNECT_BEGIN, msg="Attempting to connect to Redis server..."
         )
-        self.status, self.redis = await redis_connect(self.host_url)
+        self.status, self.redis = await redis_connect(
+            self.host_url, **self.connection_options
+        )
         if self.status == RedisStatus.CONNECTED:
+            self.circuit_breaker.record_success()
+            if self.local and self.invalidation_listener is None:
+                self.invalidation_listener = asyncio.create_task(
+                    self._listen_for_invalidations()
+                )
+            self.check_cache_script = self.redis.register_script(CHECK_CACHE_SCRIPT)
+            self.check_entities_script = self.redis.register_script(
+                CHECK_ENTITIES_SCRIPT
+            )
+            self.invalidate_entity_script = self.redis.register_script(
+                INVALIDATE_ENTITY_SCRIPT
+            )
+            self.release_lock_script = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+            self.update_usage_script = self.redis.register_script(UPDATE_USAGE_SCRIPT)
+            self.get_usage_script = self.redis.register_script(GET_USAGE_SCRIPT)
             self.log(
                 RedisEvent.CONNECT_SUCCESS, msg="Redis client is connected to server."
             )
@@ -96,6 +458,239 @@ class Cache(metaclass=MetaSingleton):
                 msg="Redis server did not respond to PING message.",
             )
 
+    async def _monitor_health(self) -> None:
+        """Ping Redis periodically to detect that it is down, or back up.
+
+        Pooled connections reconnect on their own once Redis is reachable again; if
+        the worker never connected, the client is created again.
+        """
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            if self.redis is None:
+                if self.status != RedisStatus.AUTH_ERROR:
+                    await self._connect()
+                continue
+            try:
+                await self.redis.ping()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.status == RedisStatus.CONNECTED:
+                    self.log(RedisEvent.CONNECT_FAIL, msg=str(e))
+                self.status = RedisStatus.CONN_ERROR
+            else:
+                if self.status != RedisStatus.CONNECTED:
+                    self.log(
+                        RedisEvent.CONNECT_SUCCESS,
+                        msg="Redis client is reconnected to server.",
+                    )
+                self.status = RedisStatus.CONNECTED
+                self.circuit_breaker.record_success()
+                if self.pending_invalidations:
+                    await self.invalidate_pending()
+
+    async def _publish_metrics(self) -> None:
+        """Store the metrics of the worker in Redis periodically."""
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            if self.not_connected:
+                continue
+            try:
+                await self.redis.hset(
+                    self.get_metrics_key(),
+                    self.worker_id,
+                    json.dumps({"at": time.time(), "metrics": self.metrics.snapshot()}),
+                )
+            except RedisError as e:  # pragma: no cover
+                self.record_failure(e, key=self.get_metrics_key())
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Return the metrics of every worker, added up per namespace.
+
+        The metrics of this worker are up to date, those of the other workers are at
+        most `metrics_interval` seconds old.
+        """
+        snapshots = [self.metrics.snapshot()]
+        stale_before = time.time() - self.metrics_interval * METRICS_STALE_INTERVALS
+        stale_workers = []
+        published = await self.redis.hgetall(self.get_metrics_key())
+        for worker_id, data in published.items():
+            if worker_id.decode() == self.worker_id:
+                continue
+            data = json.loads(data)
+            if data["at"] < stale_before:
+                stale_workers.append(worker_id)
+            else:
+                snapshots.append(data["metrics"])
+        if stale_workers:
+            await self.redis.hdel(self.get_metrics_key(), *stale_workers)
+        return CacheMetrics.merge(snapshots)
+
+    def set_quota(self, namespace: str, quota: Quota) -> None:
+        """Give `namespace` its own quota instead of the one passed to `init`."""
+        self.quotas[str(namespace)] = quota
+
+    def get_quota(self, namespace: str) -> Quota:
+        return self.quotas.get(str(namespace), self.quota)
+
+    def register_namespace(self, namespace: str) -> None:
+        """Record that `namespace` is cached, so its usage is reported."""
+        self.namespaces.add(str(namespace))
+
+    def get_usage_key(self, namespace: str, version: Optional[str] = None) -> str:
+        key = f"{self.get_namespace_prefix(namespace)}:{USAGE_KEY}"
+        return get_versioned_key(key, version) if version is not None else key
+
+    async def get_usage(self) -> Dict[str, Dict[str, int]]:
+        """Return the number of keys and bytes cached in each namespace, the keys
+        that the quota of the namespace rejected, and the quota.
+
+        The usage is shared by every worker, and only covers the current generation
+        of the namespace. Keys are no longer counted once they expire, are replaced
+        or are evicted; entities are counted once, apart from the responses that
+        hold them.
+        """
+        namespaces = sorted(self.namespaces)
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for namespace in namespaces:
+                await self.get_usage_script(
+                    keys=[self.get_namespace_version_key(namespace)],
+                    args=[self.get_usage_key(namespace), VERSION_SEPARATOR, now],
+                    client=pipe,
+                )
+            results = await pipe.execute()
+        usage = {}
+        for namespace, fields in zip(namespaces, results):
+            values = dict(zip(fields[::2], fields[1::2]))
+            quota = self.get_quota(namespace)
+            usage[namespace] = {
+                "keys": int(values.get(b"keys", 0)),
+                "bytes": int(values.get(b"bytes", 0)),
+                "rejected": int(values.get(b"rejected", 0)),
+                "max_keys": quota.max_keys,
+                "max_bytes": quota.max_bytes,
+            }
+        return usage
+
+    def admit(self, key: str, size: int, namespace: Optional[str] = None) -> bool:
+        """Return False if the response of `key` is too large, or its key is not
+        requested often enough, to be cached under the quota of `namespace`.
+        """
+        quota = self.get_quota(namespace)
+        if quota.max_payload_bytes and size > quota.max_payload_bytes:
+            reason = f"Value of {size} bytes is too large"
+        elif quota.min_requests and (
+            self.frequency.estimate(key.rpartition(VERSION_SEPARATOR)[0])
+            < quota.min_requests
+        ):
+            reason = "Key is not requested often enough"
+        else:
+            return True
+        self.reject(key, reason, namespace)
+        return False
+
+    def reject(self, key: str, reason: str, namespace: Optional[str] = None) -> None:
+        self.metrics.incr(namespace, "rejections")
+        self.log(RedisEvent.KEY_REJECTED, msg=reason, key=key)
+
+    def update_usage(
+        self,
+        sizes: Dict[str, int],
+        expire: int,
+        namespace: Optional[str] = None,
+        client: Optional[Pipeline] = None,
+    ) -> Awaitable[int]:
+        """Count the new versioned keys in `sizes`, with their size, in the usage of
+        `namespace` for `expire` seconds, 0 if this would exceed its quota.
+        """
+        quota = self.get_quota(namespace)
+        version = next(iter(sizes)).rpartition(VERSION_SEPARATOR)[2]
+        return self.update_usage_script(
+            keys=[self.get_usage_key(namespace, version), *sizes],
+            args=[
+                quota.max_keys,
+                quota.max_bytes,
+                expire,
+                time.time(),
+                *sizes.values(),
+            ],
+            client=client,
+        )
+
+    async def reserve(
+        self, sizes: Dict[str, int], expire: int, namespace: Optional[str] = None
+    ) -> bool:
+        """Check the quota of `namespace` before the keys in `sizes` are cached, the
+        first of them is the response.
+
+        Namespaces without limits count the keys in the same round trip as the write
+        instead (see `queue_usage`), so True is returned without a request.
+        """
+        if not self.get_quota(namespace).limits_usage:
+            return True
+        if await self.update_usage(sizes, expire, namespace):
+            return True
+        self.reject(next(iter(sizes)), "Quota of the namespace exceeded", namespace)
+        return False
+
+    async def queue_usage(
+        self,
+        pipe: Pipeline,
+        sizes: Dict[str, int],
+        expire: int,
+        namespace: Optional[str] = None,
+    ) -> int:
+        """Queue the update of the usage of a namespace without limits in `pipe`,
+        before the write of the keys in `sizes`. Returns the number of queued
+        commands.
+        """
+        if self.get_quota(namespace).limits_usage:
+            return 0
+        await self.update_usage(sizes, expire, namespace, client=pipe)
+        return 1
+
+    def allow_request(self) -> bool:
+        """True if Redis is reachable and the circuit breaker lets the request
+        through. While the circuit is half-open, this lets the trial request through,
+        whose result must be recorded.
+        """
+        return self.connected and self.circuit_breaker.allow_request()
+
+    def record_success(self) -> None:
+        self.circuit_breaker.record_success()
+
+    def record_failure(
+        self, error: Exception, key: Optional[str] = None, namespace: str = None
+    ) -> None:
+        """Log a failed Redis request, the cache is bypassed after too many of them."""
+        self.metrics.incr(namespace, "errors")
+        self.log(RedisEvent.REQUEST_FAILED, msg=str(error), key=key)
+        if self.circuit_breaker.record_failure():
+            self.log(
+                RedisEvent.CIRCUIT_OPENED,
+                msg=f"Bypassing the cache for {self.circuit_breaker.reset_timeout}s.",
+            )
+
+    async def _listen_for_invalidations(self) -> None:
+        """Evict namespaces from the in-process cache when any worker invalidates
+        them.
+        """
+        channel = self.get_invalidation_channel()
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(channel)
+                    async for message in pubsub.listen():
+                        self.local.invalidate(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # pragma: no cover
+                # Invalidation messages may have been missed while disconnected.
+                self.local.clear()
+                self.log(RedisEvent.SUBSCRIPTION_FAIL, msg=str(e), key=channel)
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+
     def request_is_not_cacheable(self, request: Request) -> bool:
         return request and (
             request.method not in ALLOWED_HTTP_TYPES
@@ -105,71 +700,689 @@ class Cache(metaclass=MetaSingleton):
             )
         )
 
+    def get_namespace_prefix(self, namespace: str) -> str:
+        return f"{self.prefix}|{namespace}"
+
     def get_cache_key(
-        self, func: Callable, namespace: str, *args: List, **kwargs: Dict
+        self,
+        func: Union[Callable, KeyBuilder],
+        namespace: str,
+        *args: List,
+        **kwargs: Dict,
     ) -> str:
-        return get_cache_key(
-            f"{self.prefix}|{namespace}", self.ignore_arg_types, func, *args, **kwargs
+        key_builder = func if isinstance(func, KeyBuilder) else KeyBuilder(func)
+        return key_builder(
+            self.get_namespace_prefix(namespace),
+            self.ignore_arg_types,
+            *args,
+            **kwargs,
         )
 
-    def get_cache_key_pattern(self, namespace: str) -> str:
-        return get_cache_key_pattern(f"{self.prefix}|{namespace}")
+    def get_namespace_version_key(self, namespace: str) -> str:
+        return get_namespace_version_key(self.get_namespace_prefix(namespace))
+
+    def get_invalidation_channel(self) -> str:
+        return f"{self.prefix}|{INVALIDATION_CHANNEL}"
+
+    def get_entity_key(
+        self, namespace: str, entity: str, id: Any, version: Any = None
+    ) -> str:
+        """Key of an entity, under the generation `version` of `namespace` if given."""
+        key = f"{self.get_entity_key_prefix(namespace, entity)}{id}"
+        return get_versioned_key(key, version) if version is not None else key
+
+    def get_entity_key_prefix(self, namespace: str, entity: str) -> str:
+        return get_entity_key_prefix(self.get_namespace_prefix(namespace), entity)
+
+    def get_entity_lists_key(self, namespace: str, entity: str) -> str:
+        return get_entity_lists_key(self.get_namespace_prefix(namespace), entity)
+
+    def get_entity_missing_key(self, namespace: str, entity: str) -> str:
+        return get_entity_missing_key(self.get_namespace_prefix(namespace), entity)
 
-    async def check_cache(self, key: str) -> Tuple[int, str]:
-        async with self.redis.pipeline() as pipe:
-            ttl, in_cache = await pipe.ttl(key).get(key).execute()
+    def get_entity_writes_key(self, namespace: str, entity: str) -> str:
+        return get_entity_writes_key(self.get_namespace_prefix(namespace), entity)
+
+    def register_entity(
+        self,
+        entity: str,
+        namespace: str,
+        schema: Optional[Type[BaseModel]] = None,
+        expire: Optional[int] = None,
+    ) -> None:
+        """Record that `namespace` caches entities of type `entity`.
+
+        If `expire` is given, changed entities are written through to the namespace
+        (cached with `schema` for `expire` seconds) instead of being evicted.
+        """
+        self.entity_namespaces.setdefault(entity, set()).add(str(namespace))
+        if expire is not None:
+            self.write_through_entities.setdefault(entity, {})[str(namespace)] = (
+                schema,
+                expire,
+            )
+
+    def get_metrics_key(self) -> str:
+        return f"{self.prefix}|{METRICS_KEY}"
+
+    def check_local_cache(self, key: str, namespace: str = None) -> Tuple[int, Any]:
+        ttl, in_cache = self.local.get(key)
+        if in_cache is not MISSING:
+            self.metrics.incr(namespace, "local_hits")
+            self.log(RedisEvent.KEY_FOUND_IN_LOCAL_CACHE, key=key)
+        return (ttl, in_cache)
+
+    async def check_cache(
+        self, namespace: str, key: str
+    ) -> Tuple[str, int, bytes, float, str]:
+        """Look up `key` under the current generation of `namespace`.
+
+        Returns the versioned key (to be used when adding the value to the cache),
+        its remaining TTL, the cached value, if any, the number of seconds it took
+        to evaluate the value and the ETag computed when it was cached.
+        """
+        started_at = time.perf_counter()
+        versioned_key, ttl, in_cache, delta, etag = await self.check_cache_script(
+            keys=[self.get_namespace_version_key(namespace)],
+            args=[key, VERSION_SEPARATOR],
+        )
+        self.metrics.observe(
+            namespace, "redis_seconds", time.perf_counter() - started_at
+        )
+        versioned_key = versioned_key.decode()
+        if in_cache:
+            self.metrics.incr(namespace, "hits")
+            self.metrics.observe(namespace, "payload_bytes", len(in_cache))
+            self.log(RedisEvent.KEY_FOUND_IN_CACHE, key=versioned_key)
+        else:
+            self.metrics.incr(namespace, "misses")
+        return (
+            versioned_key,
+            ttl,
+            decompress(in_cache),
+            float(delta or 0),
+            etag.decode() if etag else None,
+        )
+
+    async def check_entities(
+        self, namespace: str, key: str, entity: str
+    ) -> Tuple[str, int, Optional[Tuple[bytes, List[bytes]]], float, Optional[str]]:
+        """Look up a response cached by `add_entities_to_cache` and its entities.
+
+        Returns the versioned key, its remaining TTL, the cached value and entities
+        (None unless the response and every entity are cached), the number of
+        seconds it took to evaluate the value and the ETag of the response.
+        """
+        started_at = time.perf_counter()
+        (
+            versioned_key,
+            ttl,
+            in_cache,
+            delta,
+            entities,
+            etag,
+            writes,
+        ) = await self.check_entities_script(
+            keys=[self.get_namespace_version_key(namespace)],
+            args=[
+                key,
+                VERSION_SEPARATOR,
+                self.get_entity_key_prefix(namespace, entity),
+                self.get_entity_writes_key(namespace, entity),
+            ],
+        )
+        self.metrics.observe(
+            namespace, "redis_seconds", time.perf_counter() - started_at
+        )
+        versioned_key = versioned_key.decode()
+        if not in_cache or not all(entities):
+            # an evicted entity makes the whole response a miss.
+            self.metrics.incr(namespace, "misses")
+            return (versioned_key, ttl, None, float(delta or 0), None)
+        self.metrics.incr(namespace, "hits")
+        self.metrics.observe(
+            namespace, "payload_bytes", len(in_cache) + sum(map(len, entities))
+        )
+        self.log(RedisEvent.KEY_FOUND_IN_CACHE, key=versioned_key)
+        entities = [decompress(data) for data in entities]
+        return (
+            versioned_key,
+            ttl,
+            (decompress(in_cache), entities),
+            float(delta or 0),
+            self.get_entities_etag(etag, writes),
+        )
+
+    def decode_entities(
+        self, in_cache: Tuple[bytes, List[bytes]], namespace: str = None
+    ) -> Any:
+        """Rebuild a response from the value and entities read by `check_entities`."""
+        value, entities = in_cache
+        value = self.decode(value, namespace)
+        entities = [self.decode(data, namespace) for data in entities]
+        return join_entities(value["response"], entities, value["many"])
+
+    async def add_entities_to_cache(
+        self,
+        key: str,
+        value: Any,
+        expire: int,
+        entity: str,
+        entity_schema: Optional[Type[BaseModel]] = None,
+        delta: float = 0,
+        namespace: Optional[str] = None,
+    ) -> Optional[str]:
+        """Cache a response with its entities replaced by their ids.
+
+        The entities are cached separately, in the same round trip, where they are
+        shared with (and updated by) every response that holds them.
+
+        Returns the ETag of the response, computed from the response and its
+        entities when it is cached, or None if it was not cached.
+        """
+        envelope, entities, many = split_entities(value)
+        ids = [get_entity_id(item) for item in entities]
+        if any(
+            id is None or ID_SEPARATOR in str(id) or VERSION_SEPARATOR in str(id)
+            for id in ids
+        ):
+            self.log(RedisEvent.FAILED_TO_CACHE_KEY, msg="Entity without id", key=key)
+            return None
+        version = key.rpartition(VERSION_SEPARATOR)[2]
+        try:
+            started_at = time.perf_counter()
+            response_data = self.codec.encode({"response": envelope, "many": many})
+            encoded = [
+                self.codec.encode(dump_entity(item, entity_schema)) for item in entities
+            ]
+            items = {
+                self.get_entity_key(namespace, entity, id, version): data
+                for id, data in zip(ids, encoded)
+            }
+        except (TypeError, ValueError):
+            message = (
+                f"Object of type {type(value)} is not {self.codec.name}-serializable"
+            )
+            self.log(RedisEvent.FAILED_TO_CACHE_KEY, msg=message, key=key)
+            return None
+        # hashed in the order of the response, the same id may appear twice.
+        etag = self.get_etag(response_data + b"".join(encoded))
+        response_data = self.compress_value(response_data, namespace)
+        items = {k: self.compress_value(v, namespace) for k, v in items.items()}
+        self.metrics.observe(
+            namespace, "encode_seconds", time.perf_counter() - started_at
+        )
+        size = len(response_data) + sum(map(len, items.values()))
+        self.metrics.observe(namespace, "payload_bytes", size)
+        if not self.admit(key, size, namespace):
+            return None
+        # the entities are counted once, apart from the responses that hold them.
+        sizes = {key: len(response_data), **{k: len(v) for k, v in items.items()}}
+        try:
+            started_at = time.perf_counter()
+            if not await self.reserve(sizes, expire, namespace):
+                return None
+            async with self.redis.pipeline(transaction=False) as pipe:
+                queued = await self.queue_usage(pipe, sizes, expire, namespace)
+                pipe.delete(key).hset(
+                    key,
+                    mapping={
+                        "value": response_data,
+                        "delta": delta,
+                        "ids": ID_SEPARATOR.join(map(str, ids)),
+                        "etag": etag,
+                    },
+                ).expire(key, expire)
+                self.queue_set_many(pipe, items, expire)
+                if many:
+                    # lists are evicted when an entity is created, they may hold it.
+                    lists_key = get_versioned_key(
+                        self.get_entity_lists_key(namespace, entity), version
+                    )
+                    pipe.sadd(lists_key, key).expire(lists_key, expire)
+                pipe.get(
+                    get_versioned_key(
+                        self.get_entity_writes_key(namespace, entity), version
+                    )
+                )
+                results = await pipe.execute()
+                cached, writes = results[queued + 2], results[-1]
+        except RedisError as e:
+            self.record_failure(e, key=key, namespace=namespace)
+            return None
+        self.metrics.observe(
+            namespace, "redis_seconds", time.perf_counter() - started_at
+        )
+        if not cached:
+            return None
+        self.log(RedisEvent.KEY_ADDED_TO_CACHE, key=key)
+        return self.get_entities_etag(etag.encode(), writes)
+
+    async def invalidate_entity(
+        self, entity: str, id: Any = None, obj: Any = None
+    ) -> int:
+        """Evict entity `id` of type `entity` from every namespace that caches it.
+
+        Every response that holds the entity becomes a miss. Without `id`, when an
+        entity has been created, the list responses of `entity` are evicted instead,
+        since they may now hold it. Local caches are invalidated by namespace.
+
+        If `obj`, the entity after the change, is given, it is written to the
+        namespaces that registered `entity` for write-through, in the same round
+        trip, so the responses that hold it are still hits.
+
+        Returns the number of evicted keys.
+        """
+        evicted = 0
+        write_through = self.write_through_entities.get(entity, {})
+        for namespace in self.entity_namespaces.get(entity, ()):
+            if not self.connected:
+                # the whole namespace is invalidated once Redis is reachable again.
+                self.defer_invalidation(namespace)
+                continue
+            self.metrics.incr(namespace, "invalidations")
+            if self.local:
+                self.local.invalidate(namespace)
+            created = id is None
+            value, expire = b"", 0
+            if obj is not None and namespace in write_through:
+                schema, expire = write_through[namespace]
+                value = self.encode_entity(obj, schema, namespace)
+            entity_id = get_entity_id(obj) if created and value else id
+            entity_key = (
+                ""
+                if entity_id is None
+                else self.get_entity_key(namespace, entity, entity_id)
+            )
+            lists_key = missing_key = writes_key = token = ""
+            if value:
+                # changes the ETag of the responses that hold the entity.
+                writes_key = self.get_entity_writes_key(namespace, entity)
+                token = uuid4().hex[:8]
+            if created:
+                # the new entity may be in lists, and was missing until now.
+                lists_key = self.get_entity_lists_key(namespace, entity)
+                missing_key = self.get_entity_missing_key(namespace, entity)
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    # queues the script in the pipeline.
+                    await self.invalidate_entity_script(
+                        keys=[self.get_namespace_version_key(namespace)],
+                        args=[
+                            VERSION_SEPARATOR,
+                            entity_key,
+                            lists_key,
+                            value,
+                            expire,
+                            missing_key,
+                            self.get_usage_key(namespace),
+                            time.time(),
+                            writes_key,
+                            token,
+                        ],
+                        client=pipe,
+                    )
+                    pipe.publish(self.get_invalidation_channel(), namespace)
+                    count, _ = await pipe.execute()
+            except RedisError as e:
+                self.record_failure(e, key=entity_key or lists_key, namespace=namespace)
+                self.defer_invalidation(namespace)
+                continue
+            evicted += count
+            self.log(
+                RedisEvent.ENTITY_INVALIDATED,
+                key=entity_key or lists_key,
+                value=count,
+            )
+        return evicted
+
+    def encode_entity(
+        self,
+        obj: Any,
+        schema: Optional[Type[BaseModel]] = None,
+        namespace: Optional[str] = None,
+    ) -> bytes:
+        """Encode an entity as `add_entities_to_cache` caches it, b"" if it can't be."""
+        try:
+            data = self.codec.encode(dump_entity(obj, schema))
+        except (TypeError, ValueError):
+            message = (
+                f"Object of type {type(obj)} is not {self.codec.name}-serializable"
+            )
+            self.log(RedisEvent.FAILED_TO_CACHE_KEY, msg=message)
+            return b""
+        return self.compress_value(data, namespace)
+
+    @staticmethod
+    def queue_set_many(pipe: Pipeline, items: Dict[str, bytes], expire: int) -> None:
+        for key, data in items.items():
+            pipe.set(key, data, ex=expire)
+
+    async def acquire_lock(self, key: str, lease: float) -> Optional[str]:
+        """Try to lock `key` for at most `lease` seconds across all workers.
+
+        Returns the token needed to release the lock, or None if another worker
+        holds it.
+        """
+        token = uuid4().hex
+        locked = await self.redis.set(
+            get_lock_key(key), token, nx=True, px=int(lease * 1000)
+        )
+        if not locked:
+            self.log(RedisEvent.KEY_LOCKED, key=key)
+        return token if locked else None
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        try:
+            released = await self.release_lock_script(
+                keys=[get_lock_key(key)], args=[token]
+            )
+        except RedisError as e:
+            # the lock expires at the end of its lease.
+            self.record_failure(e, key=key)
+            return False
+        return bool(released)
+
+    async def wait_for_key(
+        self, key: str, timeout: float
+    ) -> Tuple[Optional[bytes], Optional[str]]:
+        """Poll for the value and ETag of `key` while another worker evaluates it."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            in_cache, etag = await self.redis.hmget(key, "value", "etag")
             if in_cache:
                 self.log(RedisEvent.KEY_FOUND_IN_CACHE, key=key)
-            return (ttl, in_cache)
+                return (decompress(in_cache), etag.decode() if etag else None)
+        return (None, None)
 
-    def requested_resource_not_modified(
-        self, request: Request, cached_data: str
-    ) -> bool:
-        if not request or "If-None-Match" not in request.headers:
+    def run_in_background(
+        self,
+        key: str,
+        func: Callable[[], Awaitable],
+        background_tasks: Optional[BackgroundTasks] = None,
+    ) -> None:
+        """Evaluate `func` after the response is returned.
+
+        If the endpoint has injected `BackgroundTasks`, `func` runs with them, before
+        the dependencies of the request (such as database sessions) are closed.
+        """
+
+        async def run():
+            try:
+                await func()
+            except Exception as e:
+                self.log(RedisEvent.FAILED_TO_CACHE_KEY, msg=str(e), key=key)
+
+        if background_tasks is not None:
+            background_tasks.add_task(run)
+            return
+        task = asyncio.create_task(run())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    def requested_resource_not_modified(self, request: Request, etag: str) -> bool:
+        if not request or not etag or "If-None-Match" not in request.headers:
             return False
         check_etags = [
             etag.strip() for etag in request.headers["If-None-Match"].split(",") if etag
         ]
         if len(check_etags) == 1 and check_etags[0] == "*":
             return True
-        return self.get_etag(cached_data) in check_etags
+        # If-None-Match uses the weak comparison.
+        return etag in check_etags or f"W/{etag}" in check_etags
 
-    async def add_to_cache(self, key: str, value: Dict, expire: int) -> bool:
+    async def add_to_cache(
+        self,
+        key: str,
+        value: Dict,
+        expire: int,
+        delta: float = 0,
+        etag: Optional[str] = None,
+        namespace: Optional[str] = None,
+    ) -> Optional[str]:
+        """Cache `value` with the time it took to evaluate and its ETag.
+
+        The ETag is computed once, here, unless the caller already has it. It is
+        computed from the uncompressed value. Returns the ETag, or None if the value
+        was not cached.
+        """
+        started_at = time.perf_counter()
         try:
             if isinstance(value, Response):
                 response_data = value.body
             else:
-                response_data = serialize_json(value)
+                response_data = self.codec.encode(value)
 
-        except TypeError:
-            message = f"Object of type {type(value)} is not JSON-serializable"
+        except (TypeError, ValueError):
+            message = (
+                f"Object of type {type(value)} is not {self.codec.name}-serializable"
+            )
             self.log(RedisEvent.FAILED_TO_CACHE_KEY, msg=message, key=key)
-            return False
-        cached = await self.redis.set(name=key, value=response_data, ex=expire)
-        if cached:
-            self.log(RedisEvent.KEY_ADDED_TO_CACHE, key=key)
-        else:  # pragma: no cover
+            return None
+        etag = etag or self.get_etag(response_data)
+        response_data = self.compress_value(response_data, namespace)
+        self.metrics.observe(
+            namespace, "encode_seconds", time.perf_counter() - started_at
+        )
+        size = len(response_data)
+        self.metrics.observe(namespace, "payload_bytes", size)
+        if not self.admit(key, size, namespace):
+            return None
+        try:
+            started_at = time.perf_counter()
+            if not await self.reserve({key: size}, expire, namespace):
+                return None
+            async with self.redis.pipeline() as pipe:
+                await self.queue_usage(pipe, {key: size}, expire, namespace)
+                *_, cached = await (
+                    pipe.delete(key)
+                    .hset(
+                        key,
+                        mapping={
+                            "value": response_data,
+                            "delta": delta,
+                            "etag": etag,
+                        },
+                    )
+                    .expire(key, expire)
+                    .execute()
+                )
+        except RedisError as e:
+            self.record_failure(e, key=key, namespace=namespace)
+            return None
+        self.metrics.observe(
+            namespace, "redis_seconds", time.perf_counter() - started_at
+        )
+        if not cached:  # pragma: no cover
             self.log(RedisEvent.FAILED_TO_CACHE_KEY, key=key, value=value)
-        return cached
+            return None
+        self.log(RedisEvent.KEY_ADDED_TO_CACHE, key=key)
+        return etag
+
+    async def add_negative_to_cache(
+        self,
+        key: str,
+        response: Response,
+        expire: int,
+        entity: Optional[str] = None,
+        namespace: Optional[str] = None,
+    ) -> bool:
+        """Cache the error `response` of `key` (such as a 404) for `expire` seconds.
+
+        It is kept apart from the responses, so it is only read when `key` misses.
+        If the response is the error of a missing `entity`, it is evicted when an
+        entity of that type is created.
+        """
+        negative_key = get_negative_key(key)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(
+                    negative_key,
+                    mapping={
+                        "value": response.body,
+                        "status": response.status_code,
+                        "media_type": response.media_type or "",
+                    },
+                ).expire(negative_key, expire)
+                if entity:
+                    # every member expires before the set.
+                    missing_key = get_versioned_key(
+                        self.get_entity_missing_key(namespace, entity),
+                        key.rpartition(VERSION_SEPARATOR)[2],
+                    )
+                    pipe.sadd(missing_key, negative_key).expire(missing_key, expire)
+                _, cached, *_ = await pipe.execute()
+        except RedisError as e:
+            self.record_failure(e, key=negative_key, namespace=namespace)
+            return False
+        self.log(RedisEvent.KEY_ADDED_TO_CACHE, key=negative_key)
+        return bool(cached)
+
+    async def check_negative(
+        self, key: str, namespace: Optional[str] = None
+    ) -> Tuple[int, Optional[Response]]:
+        """Return the remaining TTL and the error response cached for `key` by
+        `add_negative_to_cache`, if any.
+        """
+        negative_key = get_negative_key(key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            (value, status, media_type), ttl = await (
+                pipe.hmget(negative_key, "value", "status", "media_type")
+                .ttl(negative_key)
+                .execute()
+            )
+        if status is None:
+            return 0, None
+        self.metrics.incr(namespace, "negative_hits")
+        self.log(RedisEvent.KEY_FOUND_IN_CACHE, key=negative_key)
+        response = Response(
+            content=value,
+            status_code=int(status),
+            media_type=media_type.decode() or None,
+        )
+        return ttl, response
+
+    def decode(self, data: bytes, namespace: str = None) -> Any:
+        started_at = time.perf_counter()
+        value = self.codec.decode(data)
+        self.metrics.observe(
+            namespace, "decode_seconds", time.perf_counter() - started_at
+        )
+        return value
+
+    def compress_value(self, data: bytes, namespace: Optional[str] = None) -> bytes:
+        """Compress `data` if it is large enough and compression makes it smaller.
+
+        Either way the value is stored with the header that tells how it was stored.
+        """
+        size = len(data)
+        stored = store_uncompressed(data)
+        if self.compressor and size >= self.compression_threshold:
+            compressed = compress(data, self.compressor)
+            if len(compressed) < len(stored):
+                stored = compressed
+        if namespace is not None:
+            self.metrics.incr(namespace, "encoded_bytes", size)
+            self.metrics.incr(namespace, "stored_bytes", len(stored))
+        return stored
+
+    async def invalidate(self, namespace: str) -> int:
+        """Bump the generation of `namespace`.
 
-    async def invalidate(self, pattern: str) -> bool:
-        keys_to_delete = await self.redis.keys(pattern=pattern)
-        if keys_to_delete:
-            await self.redis.delete(*keys_to_delete)
-        self.log(RedisEvent.PATTERN_INVALIDATED, pattern=pattern)
+        Keys cached under the previous generation are no longer reachable and are
+        removed by Redis once their TTL expires, so no keyspace scan is needed. The
+        namespace is also published so every worker evicts it from its local cache.
+        """
+        version_key = self.get_namespace_version_key(namespace)
+        self.metrics.incr(namespace, "invalidations")
+        if self.local:
+            self.local.invalidate(str(namespace))
+        async with self.redis.pipeline(transaction=False) as pipe:
+            version, _ = await (
+                pipe.incr(version_key)
+                .publish(self.get_invalidation_channel(), str(namespace))
+                .execute()
+            )
+        self.pending_invalidations.discard(str(namespace))
+        self.log(RedisEvent.NAMESPACE_INVALIDATED, key=version_key, value=version)
+        return version
+
+    async def invalidate_or_defer(self, namespace: str) -> None:
+        """Invalidate `namespace`, or once Redis is reachable again if it isn't.
+
+        Invalidations don't wait for the circuit breaker, a write must never leave
+        stale responses in the cache.
+        """
+        if not self.connected:
+            self.defer_invalidation(namespace)
+            return
+        try:
+            await self.invalidate(namespace)
+        except RedisError as e:
+            self.record_failure(e, key=namespace, namespace=namespace)
+            self.defer_invalidation(namespace)
+
+    def defer_invalidation(self, namespace: str) -> None:
+        if self.local:
+            self.local.invalidate(str(namespace))
+        self.pending_invalidations.add(str(namespace))
+        self.log(RedisEvent.INVALIDATION_DEFERRED, key=str(namespace))
+
+    async def invalidate_pending(self) -> None:
+        """Bump the generation of the namespaces whose invalidation was deferred."""
+        for namespace in list(self.pending_invalidations):
+            try:
+                await self.invalidate(namespace)
+            except RedisError as e:
+                self.record_failure(e, key=namespace, namespace=namespace)
+                return
+
+    def get_cached_response(
+        self,
+        request: Request,
+        cached_data: bytes,
+        etag: str,
+        ttl: int,
+        cache_hit: bool = True,
+        age: int = 0,
+        cache_control: Optional[CacheControl] = CacheControl(),
+    ) -> Response:
+        """Build a response from the cached bytes without decoding or hashing them."""
+        if self.requested_resource_not_modified(request, etag):
+            response = Response(status_code=HTTPStatus.NOT_MODIFIED)
+        else:
+            response = Response(content=cached_data, media_type=self.codec.media_type)
+        self.set_response_headers(response, cache_hit, etag, ttl, age, cache_control)
+        return response
 
     def set_response_headers(
         self,
         response: Response,
         cache_hit: bool,
-        response_data: Dict = None,
+        etag: str = None,
         ttl: int = None,
+        age: int = 0,
+        cache_control: Optional[CacheControl] = CacheControl(),
     ) -> None:
+        """Set the HTTP caching headers of a response that is still fresh in the cache
+        for `ttl` seconds and was cached `age` seconds ago.
+
+        If `cache_control` is None, only the hit or miss is reported.
+        """
         response.headers[self.response_header] = "Hit" if cache_hit else "Miss"
-        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        if cache_control is None:
+            return
+        expires_at = datetime.utcnow() + timedelta(
+            seconds=cache_control.get_max_age(ttl)
+        )
         response.headers["Expires"] = expires_at.strftime(HTTP_TIME)
-        response.headers["Cache-Control"] = f"max-age={ttl}"
-        response.headers["ETag"] = self.get_etag(response_data)
+        response.headers["Cache-Control"] = cache_control.get_header(ttl, age)
+        response.headers["Age"] = str(age)
+        if cache_control.vary:
+            response.headers["Vary"] = ", ".join(cache_control.vary)
+        if etag:
+            response.headers["ETag"] = etag
         # if "last_modified" in response_data:  # pragma: no cover
         #     response.headers["Last-Modified"] = response_data["last_modified"]
 
@@ -182,7 +1395,10 @@ class Cache(metaclass=MetaSingleton):
         value: Optional[str] = None,
     ):
         """Log `RedisEvent` using the configured `Logger` object"""
-        message = f" {self.get_log_time()} | {event.name}"
+        level = EVENT_LOG_LEVELS.get(event, logging.INFO)
+        if not logger.isEnabledFor(level):
+            return
+        message = event.name
         if msg:
             message += f": {msg}"
         if key:
@@ -191,17 +1407,24 @@ class Cache(metaclass=MetaSingleton):
             message += f": pattern={pattern}"
         if value:  # pragma: no cover
             message += f", value={value}"
-        logger.info(message)
+        logger.log(level, message)
 
     @staticmethod
-    def get_etag(cached_data: Union[str, bytes, Dict]) -> str:
-        if isinstance(cached_data, bytes):
-            cached_data = cached_data.decode()
-        if not isinstance(cached_data, str):
-            cached_data = serialize_json(cached_data)
-        return f"W/{hash(cached_data)}"
+    def get_entities_etag(
+        etag: Optional[bytes], writes: Optional[bytes]
+    ) -> Optional[str]:
+        """ETag of a response cached with `add_entities_to_cache`, from the ETag
+        stored with it and the token of the last write-through of its entities.
+        """
+        if not etag:
+            return None
+        etag = etag.decode()
+        return f'{etag[:-1]}-{writes.decode()}"' if writes else etag
 
     @staticmethod
-    def get_log_time():
-        """Get a timestamp to include with a log message."""
-        return datetime.now().strftime(LOG_TIMESTAMP)
+    def get_etag(cached_data: Union[str, bytes, Dict]) -> str:
+        if isinstance(cached_data, str):
+            cached_data = cached_data.encode()
+        if not isinstance(cached_data, bytes):
+            cached_data = serialize_json(cached_data).encode()
+        return f'"{get_digest(cached_data)}"'
@@ -0,0 +1,104 @@
+"""codecs.py"""
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+
+from pydantic import BaseModel
+
+from cache.util import deserialize_json, jsonable_encoder, serialize_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+def encode_default(obj: Any) -> Any:
+    """Convert objects the binary encoders do not support natively.
+
+    Pydantic models and SQLAlchemy models are converted to dicts without walking
+    their values, which are then encoded natively by the encoder.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.dict(by_alias=True)
+    if hasattr(obj, "_sa_instance_state"):
+        return {k: v for k, v in vars(obj).items() if not k.startswith("_sa")}
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (date, datetime, time)):
+        return obj.isoformat()
+    return jsonable_encoder(obj)
+
+
+class Codec:
+    """Encodes response data to the bytes stored in Redis and decodes it back."""
+
+    name: str = None
+    media_type: str = None
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """Standard library JSON, bytes are restored on decode."""
+
+    name = "json"
+    media_type = "application/json"
+
+    def encode(self, value: Any) -> bytes:
+        return serialize_json(value).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return deserialize_json(data)
+
+
+class OrjsonCodec(Codec):
+    """orjson, datetimes are encoded natively and decoded as ISO 8601 strings, bytes
+    are decoded as strings.
+    """
+
+    name = "orjson"
+    media_type = "application/json"
+
+    def __init__(self) -> None:
+        if orjson is None:  # pragma: no cover
+            raise ImportError("orjson must be installed to use OrjsonCodec")
+
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(
+            value, default=encode_default, option=orjson.OPT_NON_STR_KEYS
+        )
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """MessagePack, bytes and timezone-aware datetimes are restored on decode."""
+
+    name = "msgpack"
+    media_type = "application/msgpack"
+
+    def __init__(self) -> None:
+        if msgpack is None:  # pragma: no cover
+            raise ImportError("msgpack must be installed to use MsgpackCodec")
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=encode_default, datetime=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, timestamp=3, strict_map_key=False)
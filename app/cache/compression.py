@@ -0,0 +1,127 @@
+"""compression.py"""
+import zlib
+from typing import Dict, Optional, Type
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+# Stored values start with this byte followed by the id of the algorithm, or
+# UNCOMPRESSED, so a value that itself starts with the marker is never taken for a
+# compressed one. Values without the marker were cached before the header existed.
+COMPRESSION_MARKER = b"\xc1"
+UNCOMPRESSED = b"\x00"
+HEADER_SIZE = 2
+
+
+class Compressor:
+    """Compresses the bytes stored in Redis and decompresses them back."""
+
+    name: str = None
+    id: bytes = None
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class ZstdCompressor(Compressor):
+    """Zstandard, the best compression ratio for its speed."""
+
+    name = "zstd"
+    id = b"\x01"
+
+    def __init__(self, level: int = 3) -> None:
+        if zstandard is None:  # pragma: no cover
+            raise ImportError("zstandard must be installed to use ZstdCompressor")
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+class Lz4Compressor(Compressor):
+    """LZ4, the fastest to compress and decompress."""
+
+    name = "lz4"
+    id = b"\x02"
+
+    def __init__(self) -> None:
+        if lz4 is None:  # pragma: no cover
+            raise ImportError("lz4 must be installed to use Lz4Compressor")
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4.frame.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lz4.frame.decompress(data)
+
+
+class ZlibCompressor(Compressor):
+    """zlib, from the standard library, used when neither zstd nor lz4 is installed."""
+
+    name = "zlib"
+    id = b"\x03"
+
+    def __init__(self, level: int = 6) -> None:
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+COMPRESSORS: Dict[str, Type[Compressor]] = {
+    compressor.name: compressor
+    for compressor in (ZstdCompressor, Lz4Compressor, ZlibCompressor)
+}
+COMPRESSORS_BY_ID: Dict[bytes, Type[Compressor]] = {
+    compressor.id: compressor for compressor in COMPRESSORS.values()
+}
+_decompressors: Dict[bytes, Compressor] = {}
+
+
+def get_compressor(name: Optional[str]) -> Optional[Compressor]:
+    """Return the compressor called `name`, or None if `name` is empty."""
+    if not name:
+        return None
+    if name not in COMPRESSORS:
+        raise ValueError(f"Unknown compressor {name!r}")
+    return COMPRESSORS[name]()
+
+
+def compress(data: bytes, compressor: Compressor) -> bytes:
+    """Compress `data` and prepend the header that identifies the algorithm."""
+    return COMPRESSION_MARKER + compressor.id + compressor.compress(data)
+
+
+def store_uncompressed(data: bytes) -> bytes:
+    """Prepend the header of a value that is stored without compression."""
+    return COMPRESSION_MARKER + UNCOMPRESSED + data
+
+
+def decompress(data: Optional[bytes]) -> Optional[bytes]:
+    """Strip the header of `data` and decompress it if it was compressed."""
+    if not data or data[:1] != COMPRESSION_MARKER:
+        return data
+    compressor_id = data[1:HEADER_SIZE]
+    if compressor_id == UNCOMPRESSED:
+        return data[HEADER_SIZE:]
+    if compressor_id not in _decompressors:
+        # values may have been compressed by another worker with another algorithm.
+        _decompressors[compressor_id] = COMPRESSORS_BY_ID[compressor_id]()
+    return _decompressors[compressor_id].decompress(data[HEADER_SIZE:])
@@ -0,0 +1,57 @@
+"""entities.py"""
+from typing import Any, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from cache.codecs import encode_default
+
+# Responses wrapped in the `APIResponse` envelope hold their data in this field.
+CONTENT_FIELD = "content"
+ID_FIELD = "id"
+ID_SEPARATOR = ","
+
+
+def split_entities(data: Any) -> Tuple[Any, List[Any], bool]:
+    """Separate the entities from the rest of the response data of an endpoint.
+
+    The entities are either the data itself or the content of an `APIResponse`
+    envelope, and are a single entity or a list of them.
+
+    Returns:
+        The envelope without its content (None if the data is not wrapped), the
+        entities and whether the response holds a list of entities.
+    """
+    envelope = None
+    if isinstance(data, dict) and CONTENT_FIELD in data:
+        envelope, data = {**data, CONTENT_FIELD: None}, data[CONTENT_FIELD]
+    if data is None:
+        return envelope, [], False
+    if isinstance(data, (list, tuple)):
+        return envelope, list(data), True
+    return envelope, [data], False
+
+
+def join_entities(envelope: Any, entities: List[Any], many: bool) -> Any:
+    """Rebuild the response data split by `split_entities`."""
+    data = entities if many else next(iter(entities), None)
+    if envelope is None:
+        return data
+    return {**envelope, CONTENT_FIELD: data}
+
+
+def dump_entity(entity: Any, schema: Optional[Type[BaseModel]] = None) -> Any:
+    """Convert an entity (such as a SQLAlchemy model) to the data that is cached.
+
+    If `schema` is given, only the fields of the schema are cached.
+    """
+    if schema is None:
+        return encode_default(entity)
+    if schema.__config__.orm_mode and not isinstance(entity, dict):
+        return schema.from_orm(entity).dict(by_alias=True)
+    return schema.parse_obj(entity).dict(by_alias=True)
+
+
+def get_entity_id(entity: Any) -> Optional[Any]:
+    if isinstance(entity, dict):
+        return entity.get(ID_FIELD)
+    return getattr(entity, ID_FIELD, None)
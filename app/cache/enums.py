@@ -19,4 +19,12 @@ class RedisEvent(IntEnum):
     KEY_ADDED_TO_CACHE = 4
     KEY_FOUND_IN_CACHE = 5
     FAILED_TO_CACHE_KEY = 6
-    PATTERN_INVALIDATED = 7
+    NAMESPACE_INVALIDATED = 7
+    KEY_FOUND_IN_LOCAL_CACHE = 8
+    SUBSCRIPTION_FAIL = 9
+    KEY_LOCKED = 10
+    REQUEST_FAILED = 11
+    CIRCUIT_OPENED = 12
+    ENTITY_INVALIDATED = 13
+    KEY_REJECTED = 14
+    INVALIDATION_DEFERRED = 15
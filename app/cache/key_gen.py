@@ -1,29 +1,98 @@
 """cache.py"""
+import json
 from collections import OrderedDict
-from inspect import signature, Signature
-from typing import Any, Callable, Dict, List
-
-from fastapi import Request, Response
-
-from cache.types import ArgType, SigParameters
-
-ALWAYS_IGNORE_ARG_TYPES = [Response, Request]
-
-
-def get_cache_key_pattern(
+from datetime import date, time
+from decimal import Decimal
+from enum import Enum
+from inspect import Parameter, signature, Signature
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import BackgroundTasks, Request, Response
+
+from cache.types import ArgType
+from cache.util import get_digest, jsonable_encoder
+
+ALWAYS_IGNORE_ARG_TYPES = [Response, Request, BackgroundTasks]
+VERSION_SEPARATOR = "#"
+# Values of these types are part of the key as they are, other values are encoded to
+# sorted JSON so equal values always produce the same key.
+SCALAR_TYPES = (str, int, float, bool, type(None), Decimal, Enum, UUID, date, time)
+# Longer argument values (and argument lists) are replaced by their digest, which
+# bounds the length of the keys.
+MAX_ARG_LENGTH = 64
+MAX_ARGS_LENGTH = 256
+HASHED_VALUE_PREFIX = "~"
+# Options of `vary_on`, headers are given as "header:<name>".
+VARY_ON_PRINCIPAL = "principal"
+VARY_ON_ROLE = "role"
+VARY_ON_HEADER_PREFIX = "header:"
+DEFAULT_PRINCIPAL_ARG = "current_user"
+
+
+def get_namespace_version_key(
     prefix: str,
 ) -> str:
-    """Generate a pattern that identifies all cache keys.
+    """Generate the key that holds the current generation of a cache namespace.
 
     Args:
         prefix (`str`): Customizable namespace value that will prefix all cache keys.
 
     Returns:
-        `str`: General for `prefix` that can be used as a
-            Redis key pattern to retrieve all cached API keys.
+        `str`: Redis key of the generation counter for `prefix`. Every cache key of
+            the namespace is suffixed with the value of this counter, so incrementing
+            it makes all previously cached keys unreachable.
+    """
+    prefix = f"{prefix}:" if prefix else ""
+    return f"{prefix}version"
+
+
+def get_versioned_key(key: str, version: int | str) -> str:
+    """Append the namespace generation `version` to the cache `key`."""
+    return f"{key}{VERSION_SEPARATOR}{version}"
+
+
+def get_entity_key_prefix(prefix: str, entity: str) -> str:
+    """Generate the prefix of the keys of the entities of type `entity`.
+
+    The id of the entity and the generation of the namespace are appended to it.
     """
     prefix = f"{prefix}:" if prefix else ""
-    return f"{prefix}*.*(*)"
+    return f"{prefix}entity:{entity}:"
+
+
+def get_entity_lists_key(prefix: str, entity: str) -> str:
+    """Generate the key of the set of responses that hold lists of `entity`."""
+    return f"{get_entity_key_prefix(prefix, entity)}lists"
+
+
+def get_entity_writes_key(prefix: str, entity: str) -> str:
+    """Generate the key of the token of the last write-through of an entity of type
+    `entity`, which is part of the ETag of the responses that hold such entities.
+    """
+    return f"{get_entity_key_prefix(prefix, entity)}writes"
+
+
+def get_entity_missing_key(prefix: str, entity: str) -> str:
+    """Generate the key of the set of the error responses cached for missing
+    entities of type `entity`, that are evicted when an entity is created.
+    """
+    return f"{get_entity_key_prefix(prefix, entity)}missing"
+
+
+def get_refresh_key(key: str) -> str:
+    """Generate the key used to coalesce background refreshes of `key`."""
+    return f"{key}:refresh"
+
+
+def get_negative_key(key: str) -> str:
+    """Generate the key of the error response (such as a 404) cached for `key`."""
+    return f"{key}:negative"
+
+
+def get_lock_key(key: str) -> str:
+    """Generate the key of the lock held while the value of `key` is evaluated."""
+    return f"{key}:lock"
 
 
 def get_cache_key(
@@ -48,18 +117,117 @@ def get_cache_key(
         `str`: Unique identifier for `func`, `*args` and `**kwargs` that can be used as a
             Redis key to retrieve cached API response data.
     """
+    return KeyBuilder(func)(prefix, ignore_arg_types, *args, **kwargs)
 
-    if not ignore_arg_types:
-        ignore_arg_types = []
-    ignore_arg_types.extend(ALWAYS_IGNORE_ARG_TYPES)
-    ignore_arg_types = list(set(ignore_arg_types))
-    prefix = f"{prefix}:" if prefix else ""
 
-    sig = signature(func)
-    sig_params = sig.parameters
-    func_args = get_func_args(sig, *args, **kwargs)
-    args_str = get_args_str(sig_params, func_args, ignore_arg_types)
-    return f"{prefix}{func.__module__}.{func.__name__}({args_str})"
+class KeyBuilder:
+    """Builds the cache keys of a function.
+
+    The signature of the function is analysed once, when the builder is created, and
+    the arguments that are part of the key are resolved once for each list of
+    ignored argument types.
+
+    Args:
+        func (`Callable`): Path operation function for an API endpoint.
+        vary_on (`Sequence[str]`): Request properties that are added to the key even
+            though they are not (or are ignored) arguments of `func`: "principal"
+            (the id of the caller), "role" (whether the caller is a superuser) and
+            "header:<name>" (the value of a request header).
+        principal_arg (`str`): Name of the argument of `func` that holds the caller.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        vary_on: Sequence[str] = (),
+        principal_arg: str = DEFAULT_PRINCIPAL_ARG,
+    ) -> None:
+        self.signature = signature(func)
+        self.func_name = f"{func.__module__}.{func.__name__}"
+        self.principal_arg = principal_arg
+        self.vary_on_principal = VARY_ON_PRINCIPAL in vary_on
+        self.vary_on_role = VARY_ON_ROLE in vary_on
+        self.vary_on_headers = [
+            option.partition(":")[2].lower()
+            for option in vary_on
+            if option.startswith(VARY_ON_HEADER_PREFIX)
+        ]
+        self.validate_vary_on(vary_on)
+        # arguments passed by keyword (as FastAPI does) are used without binding them.
+        self.binds_keywords = all(
+            param.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)
+            for param in self.signature.parameters.values()
+        )
+        self._ignore_arg_types: Optional[List[ArgType]] = None
+        self._key_params: Optional[List[Tuple[str, Any]]] = None
+
+    def get_key_params(self, ignore_arg_types: List[ArgType]) -> List[Tuple[str, Any]]:
+        """Return the name and default value of the arguments that are part of the
+        key.
+        """
+        if self._key_params is None or ignore_arg_types is not self._ignore_arg_types:
+            ignored = [*(ignore_arg_types or []), *ALWAYS_IGNORE_ARG_TYPES]
+            self._key_params = [
+                (name, param.default)
+                for name, param in self.signature.parameters.items()
+                if param.annotation not in ignored
+            ]
+            self._ignore_arg_types = ignore_arg_types
+        return self._key_params
+
+    def validate_vary_on(self, vary_on: Sequence[str]) -> None:
+        params = self.signature.parameters
+        for option in vary_on:
+            if option not in (VARY_ON_PRINCIPAL, VARY_ON_ROLE) and not (
+                option.startswith(VARY_ON_HEADER_PREFIX)
+            ):
+                raise ValueError(f"Unknown vary_on option {option!r}")
+        if (self.vary_on_principal or self.vary_on_role) and (
+            self.principal_arg not in params
+        ):
+            raise ValueError(
+                f"{self.func_name} must have a {self.principal_arg!r} argument "
+                "to vary on the principal or role"
+            )
+        if self.vary_on_headers and "request" not in params:
+            raise ValueError(
+                f"{self.func_name} must have a 'request' argument to vary on headers"
+            )
+
+    def get_vary_str(self, func_args: Dict[str, Any]) -> str:
+        """Return the compact representation of the `vary_on` values of a call."""
+        values = []
+        principal = func_args.get(self.principal_arg)
+        if self.vary_on_principal:
+            values.append(f"p={get_arg_str(getattr(principal, 'id', None))}")
+        if self.vary_on_role:
+            values.append(
+                "r=su" if getattr(principal, "is_superuser", False) else "r=u"
+            )
+        request = func_args.get("request")
+        for header in self.vary_on_headers:
+            value = request.headers.get(header) if request else None
+            values.append(f"{header}={get_arg_str(value)}")
+        return f"[{','.join(values)}]" if values else ""
+
+    def get_func_args(self, *args: List, **kwargs: Dict) -> Dict[str, Any]:
+        if args or not self.binds_keywords:
+            return get_func_args(self.signature, *args, **kwargs)
+        return kwargs
+
+    def __call__(
+        self, prefix: str, ignore_arg_types: List[ArgType], *args: List, **kwargs: Dict
+    ) -> str:
+        prefix = f"{prefix}:" if prefix else ""
+        func_args = self.get_func_args(*args, **kwargs)
+        args_str = ",".join(
+            f"{name}={get_arg_str(func_args.get(name, default))}"
+            for name, default in self.get_key_params(ignore_arg_types)
+        )
+        if len(args_str) > MAX_ARGS_LENGTH:
+            args_str = f"{HASHED_VALUE_PREFIX}{get_digest(args_str.encode())}"
+        vary_str = self.get_vary_str(func_args)
+        return f"{prefix}{self.func_name}({args_str}){vary_str}"
 
 
 def get_func_args(
@@ -71,14 +239,17 @@ def get_func_args(
     return func_args.arguments
 
 
-def get_args_str(
-    sig_params: SigParameters,
-    func_args: "OrderedDict[str, Any]",
-    ignore_arg_types: List[ArgType],
-) -> str:
-    """Return a string with the name and value of all args whose type is not included in `ignore_arg_types`"""
-    return ",".join(
-        f"{arg}={val}"
-        for arg, val in func_args.items()
-        if sig_params[arg].annotation not in ignore_arg_types
-    )
+def get_arg_str(val: Any) -> str:
+    """Return a stable string for an argument value, long values are hashed."""
+    if isinstance(val, SCALAR_TYPES):
+        val_str = str(val)
+    else:
+        try:
+            val_str = json.dumps(
+                jsonable_encoder(val), sort_keys=True, separators=(",", ":")
+            )
+        except (TypeError, ValueError):
+            val_str = str(val)
+    if len(val_str) > MAX_ARG_LENGTH:
+        return f"{HASHED_VALUE_PREFIX}{get_digest(val_str.encode())}"
+    return val_str
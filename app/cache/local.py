@@ -0,0 +1,92 @@
+"""local.py"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from cache.admission import FrequencySketch
+
+MISSING = object()
+
+
+class LocalCache:
+    """Bounded in-process LRU cache that sits in front of Redis.
+
+    Entries hold already-deserialized response data. Each namespace has an epoch
+    that is incremented when the namespace is invalidated; entries stored under an
+    older epoch are treated as misses and are evicted lazily.
+
+    If a `sketch` of the request frequency of the keys is given, a new key is only
+    admitted to a full cache if it is requested more often than the least recently
+    used entry it would evict (TinyLFU), so one-off keys do not evict popular ones.
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: int, sketch: Optional[FrequencySketch] = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sketch = sketch
+        self._entries: "OrderedDict[str, Tuple[float, float, str, int, Any]]" = (
+            OrderedDict()
+        )
+        self._epochs: Dict[str, int] = {}
+
+    def get_epoch(self, namespace: str) -> int:
+        return self._epochs.get(namespace, 0)
+
+    def get(self, key: str) -> Tuple[int, Any]:
+        """Return the number of seconds the value of `key` is still fresh in Redis,
+        and the value, or `MISSING`.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return (0, MISSING)
+        expires_at, fresh_until, namespace, epoch, value = entry
+        now = time.monotonic()
+        if expires_at <= now or epoch != self.get_epoch(namespace):
+            del self._entries[key]
+            return (0, MISSING)
+        self._entries.move_to_end(key)
+        # rounded as Redis rounds TTLs.
+        return (round(fresh_until - now), value)
+
+    def set(
+        self,
+        key: str,
+        namespace: str,
+        value: Any,
+        expire: int,
+        epoch: Optional[int] = None,
+    ) -> bool:
+        """Store `value`, which is fresh in Redis for `expire` more seconds, for at
+        most `expire` seconds (capped at the local TTL).
+
+        If `epoch` is given and the namespace has been invalidated since it was
+        read, the value is stale and it is not stored.
+        """
+        current_epoch = self.get_epoch(namespace)
+        if epoch is not None and epoch != current_epoch:
+            return False
+        ttl = min(expire, self.ttl)
+        if ttl <= 0:
+            return False
+        if (
+            self.sketch
+            and key not in self._entries
+            and len(self._entries) >= self.maxsize
+        ):
+            victim = next(iter(self._entries))
+            if self.sketch.estimate(key) <= self.sketch.estimate(victim):
+                return False
+        now = time.monotonic()
+        self._entries[key] = (now + ttl, now + expire, namespace, current_epoch, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, namespace: str) -> None:
+        self._epochs[namespace] = self.get_epoch(namespace) + 1
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -0,0 +1,122 @@
+"""metrics.py"""
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Sequence
+
+# Upper bounds of the histogram buckets, the last bucket counts larger values.
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+COUNTERS = (
+    "hits",
+    "local_hits",
+    "negative_hits",
+    "misses",
+    "bypasses",
+    "invalidations",
+    "rejections",
+    "errors",
+    # encoded and stored (possibly compressed) size of the cached values.
+    "encoded_bytes",
+    "stored_bytes",
+)
+HISTOGRAMS = {
+    "encode_seconds": LATENCY_BUCKETS,
+    "decode_seconds": LATENCY_BUCKETS,
+    "redis_seconds": LATENCY_BUCKETS,
+    "payload_bytes": SIZE_BUCKETS,
+}
+
+
+class Histogram:
+    """Counts observed values in fixed buckets and keeps their sum."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"buckets": list(self.buckets), "counts": self.counts, "sum": self.sum}
+
+
+class CacheMetrics:
+    """In-memory counters and histograms of the cache, per namespace.
+
+    Updating them costs a dict lookup and an addition, so they are safe to use on
+    the hot path. Each worker keeps its own; `snapshot` and `merge` are used to
+    aggregate the metrics of every worker.
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: dict.fromkeys(COUNTERS, 0)
+        )
+        self.histograms: Dict[str, Dict[str, Histogram]] = defaultdict(
+            lambda: {name: Histogram(buckets) for name, buckets in HISTOGRAMS.items()}
+        )
+
+    def incr(self, namespace: str, name: str, amount: int = 1) -> None:
+        self.counters[str(namespace)][name] += amount
+
+    def observe(self, namespace: str, name: str, value: float) -> None:
+        self.histograms[str(namespace)][name].observe(value)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return the metrics of this worker as a JSON-serializable dict."""
+        namespaces = set(self.counters) | set(self.histograms)
+        return {
+            namespace: {
+                **self.counters[namespace],
+                **{
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms[namespace].items()
+                },
+            }
+            for namespace in namespaces
+        }
+
+    @staticmethod
+    def merge(snapshots: Iterable[Dict[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Add up the snapshots of several workers.
+
+        The `compression_ratio` of a namespace is derived from its added up sizes.
+        """
+        merged: Dict[str, Dict[str, Any]] = {}
+        for snapshot in snapshots:
+            for namespace, metrics in snapshot.items():
+                total = merged.setdefault(namespace, {})
+                for name, value in metrics.items():
+                    if not isinstance(value, dict):
+                        total[name] = total.get(name, 0) + value
+                        continue
+                    histogram = total.setdefault(
+                        name,
+                        {
+                            "buckets": value["buckets"],
+                            "counts": [0] * len(value["counts"]),
+                            "sum": 0.0,
+                        },
+                    )
+                    histogram["counts"] = add_lists(
+                        histogram["counts"], value["counts"]
+                    )
+                    histogram["sum"] += value["sum"]
+        for total in merged.values():
+            if total.get("stored_bytes"):
+                total["compression_ratio"] = (
+                    total["encoded_bytes"] / total["stored_bytes"]
+                )
+        return merged
+
+    def clear(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+
+
+def add_lists(a: List[int], b: List[int]) -> List[int]:
+    return [x + y for x, y in zip(a, b)]
@@ -1,15 +1,32 @@
 """redis.py"""
 import os
-from typing import Tuple
+from typing import Optional, Tuple
 
 import redis.asyncio as redis
 from cache.enums import RedisStatus
 
 
-async def redis_connect(host_url: str) -> Tuple[RedisStatus, redis.Redis]:
-    """Attempt to connect to `host_url` and return a Redis client instance if successful."""
+async def redis_connect(
+    host_url: str,
+    max_connections: int = 50,
+    timeout: Optional[float] = None,
+    pool_timeout: Optional[float] = None,
+) -> Tuple[RedisStatus, redis.Redis]:
+    """Attempt to connect to `host_url` and return a Redis client instance if
+    successful.
+
+    Args:
+        host_url (str): URL for a Redis database.
+        max_connections (int, optional): Size of the connection pool. When every
+            connection is in use, commands wait for one to be released. Defaults
+            to 50.
+        timeout (float, optional): Seconds to wait to connect to Redis and for the
+            reply to a command. Defaults to None (no timeout).
+        pool_timeout (float, optional): Seconds to wait for a connection to be
+            released when the pool is exhausted. Defaults to None (no timeout).
+    """
     return (
-        await _connect(host_url)
+        await _connect(host_url, max_connections, timeout, pool_timeout)
         if os.environ.get("CACHE_ENV") != "TEST"
         else _connect_fake()
     )
@@ -17,19 +34,31 @@ async def redis_connect(host_url: str) -> Tuple[RedisStatus, redis.Redis]:
 
 async def _connect(
     host_url: str,
+    max_connections: int,
+    timeout: Optional[float],
+    pool_timeout: Optional[float],
 ) -> tuple[RedisStatus, redis.Redis]:  # pragma: no cover
+    pool = redis.BlockingConnectionPool.from_url(
+        host_url,
+        max_connections=max_connections,
+        timeout=pool_timeout,
+        socket_timeout=timeout,
+        socket_connect_timeout=timeout,
+    )
+    redis_client = redis.Redis(connection_pool=pool)
     try:
-        redis_client = await redis.from_url(host_url)
         if await redis_client.ping():
             return (RedisStatus.CONNECTED, redis_client)
-        return (RedisStatus.CONN_ERROR, None)
+        status = RedisStatus.CONN_ERROR
     except redis.AuthenticationError:
-        return (RedisStatus.AUTH_ERROR, None)
-    except redis.ConnectionError:
-        return (RedisStatus.CONN_ERROR, None)
+        status = RedisStatus.AUTH_ERROR
+    except (redis.ConnectionError, redis.TimeoutError):
+        status = RedisStatus.CONN_ERROR
+    await redis_client.close(close_connection_pool=True)
+    return (status, None)
 
 
 def _connect_fake() -> Tuple[RedisStatus, redis.Redis]:
-    from fakeredis import FakeRedis
+    from fakeredis import aioredis
 
-    return (RedisStatus.CONNECTED, FakeRedis())
+    return (RedisStatus.CONNECTED, aioredis.FakeRedis())
@@ -1,5 +1,3 @@
-from inspect import Parameter
-from typing import Mapping, Type
+from typing import Type
 
 ArgType = Type[object]
-SigParameters = Mapping[str, Parameter]
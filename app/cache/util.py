@@ -1,5 +1,6 @@
 from base64 import b64decode, b64encode
 from functools import partial
+from hashlib import blake2b
 import json
 from datetime import date, datetime
 from decimal import Decimal
@@ -18,6 +19,11 @@ from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 from pydantic import BaseModel
 from pydantic.json import ENCODERS_BY_TYPE
 
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
 DATETIME_AWARE = "%m/%d/%Y %I:%M:%S %p %z"
 DATE_ONLY = "%m/%d/%Y"
 
@@ -51,7 +57,7 @@ def serialize_json(json_dict):
             custom_encoder={
                 bytes: lambda x: {
                     "_spec_type": str(bytes),
-                    "val": b64encode(x),
+                    "val": b64encode(x).decode(),
                 },
             },
             recursion=8,
@@ -64,6 +70,16 @@ def deserialize_json(json_str):
     return json.loads(json_str, object_hook=object_hook)
 
 
+def get_digest(data: bytes) -> str:
+    """Return a digest of `data` that is stable across processes and restarts.
+
+    xxh3-128 is used if xxhash is installed, otherwise BLAKE2b (128 bits).
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(data)
+    return blake2b(data, digest_size=16).hexdigest()
+
+
 SetIntStr = Set[Union[int, str]]
 DictIntStrAny = Dict[Union[int, str], Any]
 
@@ -0,0 +1,106 @@
+"""warmup.py"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from inspect import signature
+from typing import (
+    Any,
+    AsyncContextManager,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+# While the cache is warmed up, cached responses that expire within this many
+# seconds are evaluated again. None outside of a warmup.
+refresh_window: ContextVar[Optional[float]] = ContextVar("refresh_window", default=None)
+
+WarmupParams = Iterable[Dict[str, Any]]
+WarmupDependencies = Callable[[], AsyncContextManager[Dict[str, Any]]]
+
+
+class WarmupTarget(NamedTuple):
+    func: Callable
+    params: Callable[[], WarmupParams]
+
+
+warmup_targets: List[WarmupTarget] = []
+
+
+def warmup(params: WarmupParams | Callable[[], WarmupParams]):
+    """Register a cached function to be called by `warm_up`, once for each set of
+    arguments in `params`.
+
+    Apply it above `cache`, so the cached function is registered.
+
+    Args:
+        params (Iterable[Dict[str, Any]]|Callable, optional): keyword arguments of
+            each call, such as the first pages of a list endpoint, or a function that
+            returns them when the cache is warmed up.
+    """
+
+    def outer_wrapper(func):
+        get_params = params if callable(params) else lambda: params
+        warmup_targets.append(WarmupTarget(func, get_params))
+        return func
+
+    return outer_wrapper
+
+
+@asynccontextmanager
+async def no_dependencies():
+    yield {}
+
+
+async def warm_up(
+    dependencies: WarmupDependencies = no_dependencies,
+    concurrency: int = 10,
+    refresh_within: Optional[float] = None,
+) -> Tuple[int, int]:
+    """Call every registered function with each of its sets of arguments, at most
+    `concurrency` calls at a time, so their responses are cached.
+
+    Args:
+        dependencies (Callable, optional): async context manager that provides the
+            arguments every call needs, such as a database session, for the
+            duration of one call. Only the arguments the function accepts are
+            passed to it.
+        concurrency (int, optional): maximum number of concurrent calls.
+        refresh_within (float|None, optional): evaluate responses that are already
+            cached again if they expire within this many seconds. Defaults to None
+            (they are left as they are).
+
+    Returns:
+        The number of calls and the number of calls that failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(func: Callable, params: Dict[str, Any]) -> bool:
+        async with semaphore:
+            refresh_window.set(refresh_within)
+            try:
+                async with dependencies() as kwargs:
+                    accepted = signature(func).parameters
+                    kwargs = {k: v for k, v in kwargs.items() if k in accepted}
+                    await func(**kwargs, **params)
+            except Exception:
+                logger.exception(f"Failed to warm up {func.__name__}({params})")
+                return False
+            return True
+
+    # each call runs in its own task, with its own copy of `refresh_window`.
+    results = await asyncio.gather(
+        *(
+            call(target.func, params)
+            for target in warmup_targets
+            for params in target.params()
+        )
+    )
+    return len(results), results.count(False)
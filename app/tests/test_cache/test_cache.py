@@ -0,0 +1,850 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from fakeredis import aioredis, FakeServer
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from cache import Cache, cache, codecs, invalidate, warm_up, warmup
+from cache.admission import FrequencySketch, Quota
+from cache.cache_control import CacheControl
+from cache.circuit_breaker import CircuitBreaker, CircuitState
+from cache.codecs import JsonCodec, MsgpackCodec, OrjsonCodec
+from cache.compression import (
+    COMPRESSION_MARKER,
+    decompress,
+    HEADER_SIZE,
+    ZlibCompressor,
+)
+from cache.client import (
+    CHECK_CACHE_SCRIPT,
+    CHECK_ENTITIES_SCRIPT,
+    GET_USAGE_SCRIPT,
+    HTTP_TIME,
+    INVALIDATE_ENTITY_SCRIPT,
+    RELEASE_LOCK_SCRIPT,
+    UPDATE_USAGE_SCRIPT,
+)
+from cache.enums import RedisStatus
+from cache.key_gen import KeyBuilder, MAX_ARG_LENGTH
+from cache.local import LocalCache, MISSING
+from cache.metrics import CacheMetrics
+from cache.util import ONE_YEAR_IN_SECONDS
+from cache.warmup import warmup_targets
+
+
+namespace = "test"
+
+
+@pytest.fixture
+def redis_cache() -> Cache:
+    redis_cache = Cache()
+    redis_cache.prefix = "test-cache"
+    redis_cache.response_header = "X-FastAPI-Cache"
+    redis_cache.ignore_arg_types = []
+    redis_cache.redis = aioredis.FakeRedis()
+    redis_cache.check_cache_script = redis_cache.redis.register_script(
+        CHECK_CACHE_SCRIPT
+    )
+    redis_cache.check_entities_script = redis_cache.redis.register_script(
+        CHECK_ENTITIES_SCRIPT
+    )
+    redis_cache.invalidate_entity_script = redis_cache.redis.register_script(
+        INVALIDATE_ENTITY_SCRIPT
+    )
+    redis_cache.release_lock_script = redis_cache.redis.register_script(
+        RELEASE_LOCK_SCRIPT
+    )
+    redis_cache.update_usage_script = redis_cache.redis.register_script(
+        UPDATE_USAGE_SCRIPT
+    )
+    redis_cache.get_usage_script = redis_cache.redis.register_script(GET_USAGE_SCRIPT)
+    redis_cache.status = RedisStatus.CONNECTED
+    redis_cache.local = None
+    redis_cache.codec = JsonCodec()
+    redis_cache.compressor = None
+    redis_cache.circuit_breaker = CircuitBreaker()
+    redis_cache.metrics = CacheMetrics()
+    redis_cache.quota = Quota()
+    redis_cache.quotas = {}
+    redis_cache.frequency = FrequencySketch()
+    redis_cache.pending_invalidations = set()
+    return redis_cache
+
+
+def test_cache_keys(redis_cache: Cache):
+    async def read_items(request: Request, skip: int = 0, ids: list = None):
+        pass
+
+    redis_cache.ignore_arg_types = ignore_arg_types = [int]
+    key_builder = KeyBuilder(read_items)
+    key = redis_cache.get_cache_key(key_builder, namespace, request=None, skip=1)
+    assert key.endswith("read_items(ids=None)")
+    assert key == redis_cache.get_cache_key(read_items, namespace, None, 1)
+    assert ignore_arg_types == [int]
+
+    redis_cache.ignore_arg_types = []
+    key = redis_cache.get_cache_key(key_builder, namespace, ids=[1, 2])
+    assert key.endswith("read_items(skip=0,ids=[1,2])")
+    long_key = redis_cache.get_cache_key(key_builder, namespace, ids=list(range(100)))
+    assert len(long_key) < len(key) + MAX_ARG_LENGTH
+
+
+def test_cache_keys_vary_on_principal_role_and_headers():
+    class User:
+        def __init__(self, id, is_superuser=False):
+            self.id = id
+            self.is_superuser = is_superuser
+
+    async def read_user(request: Request, user_id: int, current_user: User):
+        pass
+
+    key_builder = KeyBuilder(
+        read_user, vary_on=["principal", "role", "header:Accept-Language"]
+    )
+    request = Request({"type": "http", "headers": [(b"accept-language", b"fa")]})
+    key = key_builder("", [User], request=request, user_id=1, current_user=User(2))
+    assert key.endswith("read_user(user_id=1)[p=2,r=u,accept-language=fa]")
+    other_key = key_builder("", [User], request=None, user_id=1, current_user=User(3))
+    assert other_key.endswith("[p=3,r=u,accept-language=None]")
+
+    with pytest.raises(ValueError):
+        KeyBuilder(read_user, vary_on=["principal"], principal_arg="user")
+
+
+def test_init_connects_to_fake_redis_in_test_env(monkeypatch):
+    monkeypatch.setenv("CACHE_ENV", "TEST")
+    redis_cache = Cache()
+
+    @cache(namespace=namespace, expire=60)
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    async def run():
+        await redis_cache.init("redis://", prefix="test-env", health_check_interval=0)
+        assert redis_cache.connected
+        assert await read_item(item_id=1) == await read_item(item_id=1)
+        _, _, in_cache, *_ = await redis_cache.check_cache(
+            namespace, redis_cache.get_cache_key(read_item.__wrapped__, namespace, 1)
+        )
+        assert in_cache
+
+    asyncio.run(run())
+
+
+def test_invalidate_bumps_namespace_version(redis_cache: Cache):
+    calls = []
+
+    @cache(namespace=namespace, expire=60)
+    async def read_item(item_id: int):
+        calls.append(item_id)
+        return {"id": item_id, "calls": len(calls)}
+
+    @invalidate(namespace=namespace)
+    async def update_item():
+        return {"msg": "updated"}
+
+    async def run():
+        assert await read_item(item_id=1) == {"id": 1, "calls": 1}
+        assert await read_item(item_id=1) == {"id": 1, "calls": 1}
+        await update_item()
+        assert await read_item(item_id=1) == {"id": 1, "calls": 2}
+        return await redis_cache.redis.get(
+            redis_cache.get_namespace_version_key(namespace)
+        )
+
+    assert asyncio.run(run()) == b"1"
+    assert calls == [1, 1]
+
+
+def test_local_cache_is_evicted_by_other_workers(redis_cache: Cache):
+    calls = []
+
+    @cache(namespace=namespace, expire=60)
+    async def read_item(item_id: int):
+        calls.append(item_id)
+        return {"id": item_id}
+
+    async def run():
+        redis_cache.local = LocalCache(maxsize=10, ttl=60)
+        listener = asyncio.create_task(redis_cache._listen_for_invalidations())
+        await asyncio.sleep(0.01)
+        await read_item(item_id=1)
+        await read_item(item_id=1)
+        # served from the local cache only
+        await redis_cache.redis.flushall()
+        assert await read_item(item_id=1) == {"id": 1}
+        await redis_cache.redis.publish(
+            redis_cache.get_invalidation_channel(), namespace
+        )
+        await asyncio.sleep(0.01)
+        await read_item(item_id=1)
+        listener.cancel()
+
+    asyncio.run(run())
+    assert calls == [1, 1]
+
+
+def test_concurrent_misses_are_evaluated_once(redis_cache: Cache):
+    calls = []
+
+    @cache(namespace=namespace, expire=60, lock_timeout=1)
+    async def read_items():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [{"id": 1}]
+
+    async def run():
+        return await asyncio.gather(*(read_items() for _ in range(10)))
+
+    assert asyncio.run(run()) == [[{"id": 1}]] * 10
+    assert calls == [1]
+
+
+def test_stale_response_is_served_while_refreshed(redis_cache: Cache):
+    calls = []
+
+    @cache(namespace=namespace, expire=60, stale_ttl=60)
+    async def read_item(item_id: int):
+        calls.append(item_id)
+        return {"id": item_id, "version": len(calls)}
+
+    async def run():
+        assert await read_item(item_id=1) == {"id": 1, "version": 1}
+        key = redis_cache.get_cache_key(read_item.__wrapped__, namespace, item_id=1)
+        versioned_key, *_ = await redis_cache.check_cache(namespace, key)
+        # expire the response without removing it from the stale window
+        await redis_cache.redis.expire(versioned_key, 30)
+        assert await read_item(item_id=1) == {"id": 1, "version": 1}
+        await asyncio.gather(*redis_cache.background_tasks)
+        assert await read_item(item_id=1) == {"id": 1, "version": 2}
+
+    asyncio.run(run())
+    assert calls == [1, 1]
+
+
+UUID_VALUE = UUID(int=1)
+CREATED = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "codec_class,decoded",
+    [
+        # datetimes and Decimals are decoded as the JSON FastAPI would render.
+        (JsonCodec, {"created": CREATED.isoformat(), "raw": b"ab"}),
+        pytest.param(
+            OrjsonCodec,
+            {"created": CREATED.isoformat(), "raw": "ab"},
+            marks=pytest.mark.skipif(codecs.orjson is None, reason="needs orjson"),
+        ),
+        pytest.param(
+            MsgpackCodec,
+            {"created": CREATED, "raw": b"ab"},
+            marks=pytest.mark.skipif(codecs.msgpack is None, reason="needs msgpack"),
+        ),
+    ],
+)
+def test_codecs_round_trip(codec_class, decoded):
+    codec = codec_class()
+    value = {
+        "content": [{"id": 1, "full_name": "user"}],
+        "created": CREATED,
+        "price": Decimal("1.5"),
+        "uuid": UUID_VALUE,
+        "raw": b"ab",
+    }
+    assert codec.decode(codec.encode(value)) == {
+        "content": [{"id": 1, "full_name": "user"}],
+        "price": 1.5,
+        "uuid": str(UUID_VALUE),
+        **decoded,
+    }
+
+
+def test_large_values_are_compressed(redis_cache: Cache):
+    redis_cache.compressor = ZlibCompressor()
+    redis_cache.compression_threshold = 100
+    large, small = {"items": ["user"] * 100}, {"items": []}
+
+    async def run():
+        for key, value, compressed in (("large", large, True), ("small", small, False)):
+            versioned_key, *_ = await redis_cache.check_cache(namespace, key)
+            await redis_cache.add_to_cache(
+                versioned_key, value, 60, namespace=namespace
+            )
+            stored = await redis_cache.redis.hget(versioned_key, "value")
+            header = stored[:HEADER_SIZE]
+            assert (header == COMPRESSION_MARKER + ZlibCompressor.id) is compressed
+            _, _, in_cache, *_ = await redis_cache.check_cache(namespace, key)
+            assert redis_cache.codec.decode(in_cache) == value
+        return await redis_cache.get_metrics()
+
+    metrics = asyncio.run(run())[namespace]
+    assert metrics["stored_bytes"] < metrics["encoded_bytes"]
+    assert metrics["compression_ratio"] > 1
+
+
+def test_values_that_start_with_the_compression_marker_are_read_unchanged(
+    redis_cache: Cache,
+):
+    redis_cache.compressor = ZlibCompressor()
+    redis_cache.compression_threshold = 100
+    header = COMPRESSION_MARKER + ZlibCompressor.id
+    # a raw body that looks like a compressed value, too small to be compressed.
+    for data in (header + b"body", header + b"body" * 100):
+        assert decompress(redis_cache.compress_value(data)) == data
+
+
+def test_entity_changes_evict_only_dependent_responses(redis_cache: Cache):
+    items = {1: {"id": 1}, 2: {"id": 2}}
+    calls = []
+
+    @cache(namespace=namespace, expire=60, entity="item")
+    async def read_items():
+        calls.append("list")
+        return list(items.values())
+
+    @cache(namespace=namespace, expire=60, entity="item")
+    async def read_item(item_id: int):
+        calls.append(item_id)
+        return items[item_id]
+
+    async def read_all():
+        for _ in range(2):
+            await read_items()
+            await read_item(item_id=1)
+            await read_item(item_id=2)
+
+    async def run():
+        await read_all()
+        assert calls == ["list", 1, 2]
+        items[1] = {"id": 1, "updated": True}
+        await redis_cache.invalidate_entity("item", 1)
+        await read_all()
+        # the list response caches the entity again, for the detail response too.
+        assert calls[3:] == ["list"]
+        assert await read_item(item_id=1) == {"id": 1, "updated": True}
+        items[3] = {"id": 3}
+        await redis_cache.invalidate_entity("item")
+        await read_all()
+        assert calls[4:] == ["list"]
+        assert len(await read_items()) == 3
+
+    asyncio.run(run())
+
+
+def test_written_through_entities_stay_cached(redis_cache: Cache):
+    items = {1: {"id": 1, "name": "a"}}
+    calls = []
+
+    @cache(namespace=namespace, expire=60, entity="item", write_through=True)
+    async def read_items():
+        calls.append("list")
+        return list(items.values())
+
+    async def run():
+        await read_items()
+        items[1] = {"id": 1, "name": "b"}
+        await redis_cache.invalidate_entity("item", 1, items[1])
+        assert await read_items() == [{"id": 1, "name": "b"}]
+        assert calls == ["list"]
+        # a created entity is written, but the list responses are still evicted.
+        items[2] = {"id": 2, "name": "c"}
+        await redis_cache.invalidate_entity("item", obj=items[2])
+        assert len(await read_items()) == 2
+        assert calls == ["list", "list"]
+        key = redis_cache.get_entity_key(namespace, "item", 2, "0")
+        stored = await redis_cache.redis.get(key)
+        assert redis_cache.codec.decode(decompress(stored)) == items[2]
+
+    asyncio.run(run())
+
+
+def test_warmup_fills_and_refreshes_the_cache(redis_cache: Cache):
+    # the endpoints of the application may have registered targets.
+    targets = warmup_targets[:]
+    warmup_targets.clear()
+    calls = []
+
+    @warmup([{"page": page} for page in range(5)])
+    @cache(namespace=namespace, expire=60)
+    async def read_items(page: int, db=None):
+        assert db == "session"
+        calls.append(page)
+        return [page]
+
+    @asynccontextmanager
+    async def dependencies():
+        yield {"db": "session", "request": None}
+
+    async def run():
+        assert await warm_up(dependencies, concurrency=2) == (5, 0)
+        assert sorted(calls) == [0, 1, 2, 3, 4]
+        await read_items(page=0, db="session")
+        assert len(calls) == 5
+        # responses are only evaluated again if they expire within the window.
+        await warm_up(dependencies, refresh_within=10)
+        assert len(calls) == 5
+        await warm_up(dependencies, refresh_within=60)
+        assert len(calls) == 10
+
+    try:
+        asyncio.run(run())
+    finally:
+        warmup_targets[:] = targets
+
+
+def test_quotas_limit_what_namespaces_cache(redis_cache: Cache):
+    calls = []
+
+    @cache(namespace=namespace, expire=60)
+    async def read_item(item_id: int, size: int = 1):
+        calls.append(item_id)
+        return "x" * size
+
+    @invalidate(namespace=namespace)
+    async def update_item():
+        return None
+
+    async def run():
+        redis_cache.set_quota(namespace, Quota(max_keys=2, max_payload_bytes=100))
+        for _ in range(2):
+            for item_id in (1, 2, 3):
+                await read_item(item_id=item_id)
+            await read_item(item_id=4, size=200)
+        # 3 is over the key quota and 4 is too large, they are never cached.
+        assert calls == [1, 2, 3, 4, 3, 4]
+        usage = (await redis_cache.get_usage())[namespace]
+        assert (usage["keys"], usage["rejected"], usage["max_keys"]) == (2, 2, 2)
+        assert usage["bytes"] > 0
+        assert redis_cache.metrics.counters[namespace]["rejections"] == 4
+        # a new generation of the namespace has its own usage.
+        await update_item()
+        assert (await redis_cache.get_usage())[namespace]["keys"] == 0
+
+        redis_cache.set_quota(namespace, Quota(min_requests=2))
+        await read_item(item_id=5)
+        await read_item(item_id=5)
+        await read_item(item_id=5)
+        assert calls[6:] == [5, 5]
+
+    asyncio.run(run())
+
+
+def test_usage_shrinks_when_keys_expire_or_are_evicted(redis_cache: Cache, monkeypatch):
+    items = [{"id": 1}, {"id": 2}]
+
+    @cache(namespace=namespace, expire=60, entity="item")
+    async def read_items(skip: int = 0):
+        return items[skip:]
+
+    async def get_usage():
+        usage = (await redis_cache.get_usage())[namespace]
+        return usage["keys"], usage["bytes"]
+
+    async def run():
+        await read_items(skip=0)
+        await read_items(skip=1)
+        # the entities the responses share are counted once.
+        keys, _ = await get_usage()
+        assert keys == 4
+        # a replaced key is counted with its new size.
+        key, *_ = await redis_cache.check_cache(namespace, "key")
+        await redis_cache.add_to_cache(key, "x" * 100, 60, namespace=namespace)
+        _, before = await get_usage()
+        await redis_cache.add_to_cache(key, "x", 60, namespace=namespace)
+        assert await get_usage() == (5, before - 99)
+        # the list responses are evicted when an item is created.
+        await redis_cache.invalidate_entity("item")
+        assert (await get_usage())[0] == 3
+        later = time.time() + 61
+        monkeypatch.setattr(time, "time", lambda: later)
+        assert await get_usage() == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_local_cache_admits_frequent_keys():
+    sketch = FrequencySketch(width=64)
+    local = LocalCache(maxsize=2, ttl=60, sketch=sketch)
+    for key in ("a", "a", "b", "b", "c"):
+        sketch.increment(key)
+    assert local.set("a", namespace, 1, 60)
+    assert local.set("b", namespace, 2, 60)
+    # "c" is requested less often than "a", the entry it would evict.
+    assert not local.set("c", namespace, 3, 60)
+    for _ in range(3):
+        sketch.increment("c")
+    assert local.set("c", namespace, 3, 60)
+    assert local.get("a") == (0, MISSING)
+    assert local.get("c")[1] == 3
+
+
+def test_metrics_are_aggregated_across_workers(redis_cache: Cache):
+    @cache(namespace=namespace, expire=60)
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    @invalidate(namespace=namespace)
+    async def update_item():
+        return None
+
+    other_worker = CacheMetrics()
+    other_worker.incr(namespace, "hits", 3)
+    other_worker.observe(namespace, "redis_seconds", 0.002)
+
+    async def run():
+        await read_item(item_id=1)
+        await read_item(item_id=1)
+        await update_item()
+        await redis_cache.redis.hset(
+            redis_cache.get_metrics_key(),
+            "other-worker",
+            json.dumps({"at": time.time(), "metrics": other_worker.snapshot()}),
+        )
+        return await redis_cache.get_metrics()
+
+    metrics = asyncio.run(run())[namespace]
+    assert (metrics["hits"], metrics["misses"], metrics["invalidations"]) == (4, 1, 1)
+    assert sum(metrics["redis_seconds"]["counts"]) == 4
+    assert sum(metrics["payload_bytes"]["counts"]) == 2
+
+
+def test_cache_is_bypassed_while_redis_is_down(redis_cache: Cache):
+    server = FakeServer()
+    redis_cache.redis = aioredis.FakeRedis(server=server)
+    redis_cache.check_cache_script = redis_cache.redis.register_script(
+        CHECK_CACHE_SCRIPT
+    )
+    redis_cache.circuit_breaker = CircuitBreaker(failure_threshold=2)
+
+    @cache(namespace=namespace, expire=60)
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    async def run():
+        server.connected = False
+        for _ in range(3):
+            assert await read_item(item_id=1) == {"id": 1}
+        assert redis_cache.circuit_breaker.state == CircuitState.OPEN
+        assert not redis_cache.allow_request()
+
+        server.connected = True
+        redis_cache.circuit_breaker.opened_at -= (
+            redis_cache.circuit_breaker.reset_timeout
+        )
+        assert await read_item(item_id=1) == {"id": 1}
+        assert redis_cache.circuit_breaker.state == CircuitState.CLOSED
+
+    asyncio.run(run())
+
+
+def test_invalidations_are_delivered_once_redis_is_back(redis_cache: Cache):
+    calls = []
+
+    @cache(namespace=namespace, expire=60)
+    async def read_item(item_id: int):
+        calls.append(item_id)
+        return {"id": item_id}
+
+    @invalidate(namespace=namespace)
+    async def update_item():
+        return None
+
+    async def run():
+        await read_item(item_id=1)
+        # an open circuit doesn't stop invalidations.
+        redis_cache.circuit_breaker.state = CircuitState.OPEN
+        redis_cache.circuit_breaker.opened_at = time.monotonic()
+        await update_item()
+        redis_cache.circuit_breaker.record_success()
+        await read_item(item_id=1)
+        assert calls == [1, 1]
+
+        redis_cache.status = RedisStatus.CONN_ERROR
+        await update_item()
+        assert redis_cache.pending_invalidations == {namespace}
+        redis_cache.status = RedisStatus.CONNECTED
+        await read_item(item_id=1)
+        assert calls == [1, 1]
+        await redis_cache.invalidate_pending()
+        assert not redis_cache.pending_invalidations
+        await read_item(item_id=1)
+        assert calls == [1, 1, 1]
+
+    asyncio.run(run())
+
+
+class Item(BaseModel):
+    id: int
+
+
+def test_list_and_detail_responses_share_entities(redis_cache: Cache):
+    items = {1: {"id": 1, "name": "one"}, 2: {"id": 2, "name": "two"}}
+    calls = []
+
+    @cache(namespace=namespace, expire=60, entity="item", entity_schema=Item)
+    async def read_items():
+        calls.append("list")
+        return {"header": {"status": 0}, "content": list(items.values())}
+
+    @cache(namespace=namespace, expire=60, entity="item", entity_schema=Item)
+    async def read_item(item_id: int):
+        calls.append(item_id)
+        return items[item_id]
+
+    async def run():
+        await read_items()
+        await read_item(item_id=1)
+        # only the fields of the schema are cached.
+        assert await read_items() == {
+            "header": {"status": 0},
+            "content": [{"id": 1}, {"id": 2}],
+        }
+        assert await read_item(item_id=1) == {"id": 1}
+        assert calls == ["list", 1]
+
+        key = redis_cache.get_entity_key(namespace, "item", 2, version=0)
+        # the entity is cached once, encoded as the response values are.
+        stored = await redis_cache.redis.get(key)
+        assert redis_cache.codec.decode(decompress(stored)) == {"id": 2}
+        await redis_cache.redis.delete(key)
+        await read_items()
+        assert calls == ["list", 1, "list"]
+
+    asyncio.run(run())
+
+
+def test_http_caching_headers(redis_cache: Cache):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    @cache(
+        namespace=namespace,
+        expire=60,
+        stale_ttl=10,
+        vary_on=["header:X-Tenant"],
+        cache_control=CacheControl(private=False),
+    )
+    async def read_item(request: Request, item_id: int):
+        return {"id": item_id}
+
+    @app.get("/me")
+    @cache(
+        namespace=namespace,
+        expire=60,
+        vary_on=["principal"],
+        cache_control=CacheControl(max_age=30),
+    )
+    async def read_me(current_user: int = 1):
+        return {"id": current_user}
+
+    with TestClient(app) as client:
+        miss = client.get("/items/1")
+        hit = client.get("/items/1")
+        me = client.get("/me")
+
+    assert miss.json() == hit.json() == {"id": 1}
+    assert miss.headers["X-FastAPI-Cache"] == "Miss"
+    assert hit.headers["X-FastAPI-Cache"] == "Hit"
+    # the max-age counts from when the response was cached, clients subtract the Age.
+    for response in (miss, hit):
+        assert response.headers["Cache-Control"] == (
+            "public, max-age=60, stale-while-revalidate=10"
+        )
+        assert response.headers["Vary"] == "X-Tenant"
+        assert "Expires" in response.headers
+    assert miss.headers["Age"] == "0"
+    assert "ETag" in hit.headers
+    assert me.headers["Cache-Control"] == "private, max-age=30"
+    assert me.headers["Vary"] == "Authorization"
+
+
+def test_responses_are_private_unless_the_endpoint_opts_in(redis_cache: Cache):
+    app = FastAPI()
+
+    async def get_current_user(authorization: str = Header()) -> int:
+        return 1
+
+    # requires authentication, but doesn't vary on the caller.
+    @app.get("/account")
+    @cache(namespace=namespace, expire=ONE_YEAR_IN_SECONDS)
+    async def read_account(request: Request, user: int = Depends(get_current_user)):
+        return {"id": user}
+
+    with TestClient(app) as client:
+        miss = client.get("/account", headers={"Authorization": "Bearer token"})
+        hit = client.get("/account", headers={"Authorization": "Bearer token"})
+
+    for response in (miss, hit):
+        assert response.headers["Cache-Control"].startswith("private, max-age=")
+        assert "s-maxage" not in response.headers["Cache-Control"]
+
+
+def test_entity_responses_are_revalidated_with_etags(redis_cache: Cache):
+    app = FastAPI()
+    items = {1: {"id": 1, "name": "a"}}
+
+    @app.get("/items/{item_id}")
+    @cache(
+        namespace=namespace,
+        expire=60,
+        entity="item",
+        write_through=True,
+        cache_control=CacheControl(no_cache=True),
+    )
+    async def read_item(request: Request, item_id: int):
+        return items[item_id]
+
+    with TestClient(app) as client:
+        miss = client.get("/items/1")
+        hit = client.get("/items/1")
+        not_modified = client.get(
+            "/items/1", headers={"If-None-Match": hit.headers["ETag"]}
+        )
+        items[1] = {"id": 1, "name": "b"}
+        client.portal.call(redis_cache.invalidate_entity, "item", 1, items[1])
+        updated = client.get("/items/1", headers={"If-None-Match": hit.headers["ETag"]})
+
+    assert miss.headers["ETag"] == hit.headers["ETag"]
+    for response in (miss, hit, not_modified):
+        assert response.headers["Cache-Control"] == "private, no-cache"
+    assert not_modified.status_code == 304
+    # the written through entity changes the ETag of the cached response.
+    assert updated.headers["X-FastAPI-Cache"] == "Hit"
+    assert updated.json() == {"id": 1, "name": "b"}
+    assert updated.headers["ETag"] != hit.headers["ETag"]
+
+
+def test_entity_etags_hold_repeated_entities(redis_cache: Cache):
+    app = FastAPI()
+
+    @app.get("/items")
+    @cache(namespace=namespace, expire=60, entity="item")
+    async def read_items(request: Request):
+        return [{"id": 1}, {"id": 2}, {"id": 1}]
+
+    with TestClient(app) as client:
+        miss = client.get("/items")
+        hit = client.get("/items")
+        not_modified = client.get(
+            "/items", headers={"If-None-Match": miss.headers["ETag"]}
+        )
+
+    assert hit.headers["X-FastAPI-Cache"] == "Hit"
+    assert hit.json() == [{"id": 1}, {"id": 2}, {"id": 1}]
+    # the digest of the response and its entities in order, repeated ones included.
+    encode = redis_cache.codec.encode
+    etag = Cache.get_etag(
+        encode({"response": None, "many": True})
+        + b"".join(encode(item) for item in hit.json())
+    )
+    assert miss.headers["ETag"] == hit.headers["ETag"] == etag
+    assert not_modified.status_code == 304
+
+
+def test_responses_that_are_not_cached_are_not_stored(redis_cache: Cache):
+    redis_cache.set_quota(namespace, Quota(max_payload_bytes=10))
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    @cache(namespace=namespace, expire=60)
+    async def read_item(request: Request, item_id: int):
+        return "x" * item_id
+
+    with TestClient(app) as client:
+        small = client.get("/items/1")
+        large = client.get("/items/100")
+
+    assert small.headers["Cache-Control"] == "private, max-age=60"
+    assert large.headers["X-FastAPI-Cache"] == "Miss"
+    assert large.headers["Cache-Control"] == "no-store"
+
+
+def test_local_hits_report_the_redis_expiry(redis_cache: Cache):
+    redis_cache.local = LocalCache(maxsize=10, ttl=30)
+    app = FastAPI()
+    calls = []
+
+    @app.get("/items/{item_id}")
+    @cache(namespace=namespace, expire=3600)
+    async def read_item(request: Request, item_id: int):
+        calls.append(item_id)
+        return {"id": item_id}
+
+    with TestClient(app) as client:
+        responses = [client.get("/items/1") for _ in range(3)]
+
+    # the third response is served by the local cache, which keeps it for 30s.
+    assert calls == [1]
+    assert redis_cache.metrics.counters[namespace]["local_hits"] == 1
+    for response in responses:
+        assert response.headers["Age"] == "0"
+        assert response.headers["Cache-Control"] == "private, max-age=3600"
+        expires = datetime.strptime(response.headers["Expires"], HTTP_TIME)
+        assert expires - datetime.utcnow() > timedelta(seconds=3590)
+
+
+def test_not_found_responses_are_cached_until_created(redis_cache: Cache):
+    app = FastAPI()
+    items = {}
+    calls = []
+
+    class NotFound(HTTPException):
+        pass
+
+    @app.exception_handler(NotFound)
+    async def not_found_handler(request: Request, exc: NotFound):
+        return JSONResponse({"header": {"status": 2}, "content": exc.detail}, 404)
+
+    @app.get("/items/{item_id}")
+    @cache(namespace=namespace, expire=60, entity="item", negative_ttl=10)
+    async def read_item(request: Request, item_id: int):
+        calls.append(item_id)
+        if item_id not in items:
+            raise NotFound(status_code=404, detail="Item not found")
+        return items[item_id]
+
+    with TestClient(app) as client:
+        miss = client.get("/items/1")
+        hit = client.get("/items/1")
+        assert calls == [1]
+        items[1] = {"id": 1}
+        client.portal.call(redis_cache.invalidate_entity, "item")
+        created = client.get("/items/1")
+
+    assert miss.status_code == hit.status_code == 404
+    assert hit.json() == {"header": {"status": 2}, "content": "Item not found"}
+    assert hit.headers["X-FastAPI-Cache"] == "Hit"
+    assert created.json() == {"id": 1}
+    assert calls == [1, 1]
+
+
+def test_raw_response_hits_and_not_modified(redis_cache: Cache):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    @cache(namespace=namespace, expire=60, raw_response=True)
+    async def read_item(request: Request, item_id: int) -> Item:
+        return {"id": item_id, "secret": "not in the response model"}
+
+    with TestClient(app) as client:
+        miss = client.get("/items/1")
+        hit = client.get("/items/1")
+        not_modified = client.get(
+            "/items/1", headers={"If-None-Match": hit.headers["ETag"]}
+        )
+
+    assert miss.json() == hit.json() == {"id": 1}
+    assert miss.headers["X-FastAPI-Cache"] == "Miss"
+    assert hit.headers["X-FastAPI-Cache"] == "Hit"
+    assert miss.headers["ETag"] == hit.headers["ETag"] == Cache.get_etag(hit.content)
+    assert not_modified.status_code == 304
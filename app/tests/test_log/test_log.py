@@ -0,0 +1,38 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.log import log
+from app.log.log import LogRoute, format_request_log
+from app.log.policy import LogPolicy, REDACTED
+
+
+def test_request_body_is_captured_once(monkeypatch):
+    rows = []
+    monkeypatch.setattr(log.request_log_writer, "enqueue", rows.append)
+    monkeypatch.setattr(
+        log, "get_log_policy", lambda path: LogPolicy(max_body_bytes=60)
+    )
+    app = FastAPI()
+    app.router.route_class = LogRoute
+
+    @app.post("/login")
+    async def login(body: dict):
+        return {"access_token": "abc", "user": body["user"]}
+
+    client = TestClient(app)
+    body = {"user": "a", "password": "secret", "padding": "x" * 100}
+    response = client.post("/login", json=body, headers={"Authorization": "Bearer abc"})
+    assert response.status_code == 200
+
+    (row,) = rows
+    # the log keeps the bytes read by the handler, up to the cap.
+    assert bytes(row["request"]["body"]) == json.dumps(body).encode()[:60]
+    row = format_request_log(row)
+    request_body = json.loads(row["request"])["body"]
+    assert request_body.startswith(f'{{"user": "a", "password": {REDACTED}')
+    size = len(json.dumps(body))
+    assert request_body.endswith(f"...[truncated {size - 60} bytes]")
+    assert json.loads(row["response"])["access_token"] == REDACTED
+    assert row["authorization"] == f"Bearer {REDACTED}"
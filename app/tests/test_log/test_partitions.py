@@ -0,0 +1,16 @@
+from datetime import date
+
+from app.log.partitions import get_expired_partitions, get_month, get_partition_name
+
+
+def test_expired_partitions_are_whole_months_before_cutoff():
+    assert get_month(date(2026, 12, 31), 1) == date(2027, 1, 1)
+    assert get_month(date(2026, 1, 15), -13) == date(2024, 12, 1)
+    names = [get_partition_name(date(2026, month, 1)) for month in (3, 4, 5)]
+    names += ["requestlog_default", "requestlog_p2026xx"]
+    # the April partition still holds logs created after the cutoff.
+    assert get_expired_partitions(names, date(2026, 4, 15)) == ["requestlog_p202603"]
+    assert get_expired_partitions(names, date(2026, 5, 1)) == [
+        "requestlog_p202603",
+        "requestlog_p202604",
+    ]
@@ -0,0 +1,39 @@
+import json
+
+from app.log import policy
+from app.log.policy import (
+    LogPolicy,
+    REDACTED,
+    format_body,
+    get_log_policy,
+    redact_authorization,
+)
+
+
+def test_secrets_are_redacted_and_bodies_truncated():
+    body = {"email": "a@b.c", "password": "x", "tokens": [{"refresh_token": "y"}]}
+    assert json.loads(format_body(json.dumps(body).encode(), 1000)) == {
+        "email": "a@b.c",
+        "password": REDACTED,
+        "tokens": [{"refresh_token": REDACTED}],
+    }
+    assert format_body(b"username=a&password=secret", 1000) == (
+        f"username=a&password={REDACTED}"
+    )
+    assert (
+        format_body(b'"' + b"a" * 100 + b'"', 10) == '"aaaaaaaaa...[truncated 92 bytes]'
+    )
+    assert format_body(b"{}", 0) == ""
+    assert redact_authorization("Bearer abc.def") == f"Bearer {REDACTED}"
+
+
+def test_policy_of_longest_prefix_applies(monkeypatch):
+    users = LogPolicy(sample_rate=0)
+    monkeypatch.setattr(
+        policy, "log_policies", {"/api": LogPolicy(), "/api/users": users}
+    )
+    assert get_log_policy("/api/users/1") is users
+    assert get_log_policy("/docs") is policy.default_log_policy
+    # failed requests are logged whatever the sample rate.
+    assert not users.should_log(200)
+    assert users.should_log(503)
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime
+
+from fakeredis import aioredis
+
+from app.core.config import settings
+from app.log import sinks
+from app.log.sinks import (
+    add_request_logs_to_stream,
+    consume_request_log_stream,
+    decode_request_logs,
+    encode_request_logs,
+    get_request_log_sink,
+    RequestLogSink,
+)
+from app.log.writer import write_request_logs
+
+
+def test_logs_are_added_to_stream(monkeypatch):
+    redis_client = aioredis.FakeRedis()
+    monkeypatch.setattr(sinks, "_redis", redis_client)
+    now = datetime.utcnow()
+    assert get_request_log_sink("db") is write_request_logs
+    assert get_request_log_sink("redis") is add_request_logs_to_stream
+
+    async def run():
+        await get_request_log_sink(RequestLogSink.REDIS)([{"id": 1, "created": now}])
+        ((_, fields),) = await redis_client.xrange(settings.REQUEST_LOG_STREAM)
+        # the datetimes of the logs survive the round trip.
+        assert decode_request_logs(fields[b"rows"]) == [{"id": 1, "created": now}]
+
+    asyncio.run(run())
+
+
+class StreamClient:
+    """A stream with one consumer group, fakeredis doesn't support them."""
+
+    def __init__(self, entries):
+        self.entries = dict(entries)
+        self.new = list(self.entries)
+        # the consumer of each entry read but not acknowledged.
+        self.pending = {}
+        self.deleted = []
+
+    async def xgroup_create(self, *args, **kwargs):
+        pass
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, **kwargs):
+        # every pending entry counts as idle.
+        claimed = [(id, self.entries.get(id)) for id in self.pending]
+        self.pending.update(dict.fromkeys(self.pending, consumer))
+        return [b"0-0", claimed, []]
+
+    async def xreadgroup(self, group, consumer, streams, count):
+        ids, self.new = self.new[:count], self.new[count:]
+        self.pending.update(dict.fromkeys(ids, consumer))
+        entries = [(id, self.entries[id]) for id in ids]
+        return [(settings.REQUEST_LOG_STREAM, entries)] if entries else []
+
+    async def xack(self, stream, group, entry_id):
+        self.pending.pop(entry_id)
+
+    async def xdel(self, stream, entry_id):
+        del self.entries[entry_id]
+        self.deleted.append(entry_id)
+
+
+def test_failed_stream_entries_are_written_by_a_later_consumer(monkeypatch):
+    first, second = [{"id": 1}], [{"id": 2}]
+    redis_client = StreamClient(
+        [
+            (b"1-0", {b"rows": encode_request_logs(first)}),
+            (b"2-0", {b"rows": encode_request_logs(second)}),
+        ]
+    )
+    written = []
+
+    async def fail_first(rows):
+        if rows == first:
+            raise ConnectionError("database is down")
+        written.extend(rows)
+
+    async def write(rows):
+        written.extend(rows)
+
+    monkeypatch.setattr(settings, "REQUEST_LOG_STREAM_CONSUMER", "old")
+    # the failed batch doesn't stop the next ones.
+    assert asyncio.run(consume_request_log_stream(redis_client, fail_first)) == 1
+    assert written == second
+    assert redis_client.pending == {b"1-0": "old"}
+
+    # e.g. the scheduler was redeployed under another consumer name.
+    monkeypatch.setattr(settings, "REQUEST_LOG_STREAM_CONSUMER", "new")
+    assert asyncio.run(consume_request_log_stream(redis_client, write)) == 1
+    assert written == second + first
+    assert redis_client.pending == {}
+    assert redis_client.deleted == [b"2-0", b"1-0"]
+
+
+def test_trimmed_stream_entries_are_acknowledged():
+    rows = [{"id": 2}]
+    redis_client = StreamClient([(b"2-0", {b"rows": encode_request_logs(rows)})])
+    # a pending entry trimmed by MAXLEN is claimed without its fields.
+    redis_client.pending[b"1-0"] = "old"
+    written = []
+
+    async def write(batch):
+        written.extend(batch)
+
+    assert asyncio.run(consume_request_log_stream(redis_client, write)) == 1
+    assert written == rows
+    assert redis_client.pending == {}
+    assert redis_client.deleted == [b"2-0"]
@@ -0,0 +1,44 @@
+import asyncio
+
+from app.log.writer import OverflowPolicy, RequestLogWriter
+
+
+def test_logs_are_written_in_batches():
+    batches = []
+
+    async def write(rows):
+        batches.append(rows)
+
+    async def run():
+        writer = RequestLogWriter(batch_size=3, flush_interval=0.05, write=write)
+        for i in range(4):
+            writer.enqueue({"id": i})
+        await asyncio.sleep(0.01)
+        # a full batch is written at once, the rest after the flush interval.
+        assert batches == [[{"id": 0}, {"id": 1}, {"id": 2}]]
+        await asyncio.sleep(0.1)
+        assert batches[1:] == [[{"id": 3}]]
+        writer.enqueue({"id": 4})
+        await writer.stop()
+        assert batches[2:] == [[{"id": 4}]]
+        assert writer.written == 5
+
+    asyncio.run(run())
+
+
+def test_full_queue_drops_logs():
+    async def write(rows):
+        raise AssertionError("the writer is not running")
+
+    async def run():
+        writer = RequestLogWriter(max_size=4, write=write)
+        assert [writer.enqueue({"id": i}) for i in range(5)] == [True] * 4 + [False]
+        assert writer.dropped == 1
+        writer.overflow = OverflowPolicy.SAMPLE
+        writer.queue.get_nowait()
+        # with one of the two slots above half full left, logs are kept half the time.
+        kept = sum(writer._admit() for _ in range(1000))
+        assert 350 < kept < 650
+        writer.task.cancel()
+
+    asyncio.run(run())
@@ -0,0 +1,19 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[2]
+SCHEDULE = ROOT / "app" / "utils" / "schedule.py"
+
+
+def test_scheduler_imports_when_run_as_a_script():
+    # the scheduler is started as `python app/utils/schedule.py`, so its directory
+    # comes first on sys.path and must not shadow top-level packages.
+    code = (
+        f"import runpy, sys; sys.path.insert(0, {str(SCHEDULE.parent)!r}); "
+        f"runpy.run_path({str(SCHEDULE)!r})"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
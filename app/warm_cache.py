@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import logging
+
+from app.api.api_v1 import api  # noqa: F401 registers the warmup of the endpoints
+from app.core.config import settings
+from app.utils.cache_setup import init_cache, warmup_dependencies
+from cache import warm_up
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def warm(concurrency: int, refresh_within: float | None) -> None:
+    redis_cache = await init_cache()
+    if not redis_cache.connected:
+        logger.error("Redis is not connected, the cache can not be warmed up")
+        return
+    calls, failures = await warm_up(warmup_dependencies, concurrency, refresh_within)
+    logger.info(f"Cache warmed up with {calls} calls, {failures} failed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fill the cache of the endpoints.")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.CACHE_WARMUP_CONCURRENCY
+    )
+    parser.add_argument(
+        "--refresh-within",
+        type=float,
+        default=None,
+        help="also refresh cached responses that expire within this many seconds",
+    )
+    options = parser.parse_args()
+    asyncio.run(warm(options.concurrency, options.refresh_within))
+
+
+if __name__ == "__main__":
+    main()
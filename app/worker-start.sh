@@ -3,4 +3,4 @@ set -e
 
 python /app/app/celery/celeryworker_pre_start.py
 
-celery -A app.celery.worker worker --loglevel=INFO -Q main-queue
+celery -A app.celery.worker worker --loglevel=INFO -Q main-queue,request-log-queue